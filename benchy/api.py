@@ -1,2 +1,6 @@
-from benchy.benchmark import Benchmark, BenchmarkSuite
+from benchy.benchmark import Benchmark, BenchmarkSuite, Fixture, \
+    ArrayFixture, benchmark
 from benchy.runner import BenchmarkRunner
+from benchy.db import BenchmarkDB
+from benchy.revisions import RevisionRunner
+from benchy.compare import compare
@@ -1,42 +1,493 @@
+import os
+import sys
+import copy
+import time
+import atexit
+import itertools
+import tempfile
 import traceback
 import cProfile
 import pstats
 import hashlib
+import inspect
+import textwrap
+import functools
 from cStringIO import StringIO
-from utils import indent, magic_timeit, magic_memit, getTable
+import numpy as np
+from utils import indent, magic_timeit, magic_memit, magic_allocit, \
+    magic_latency, magic_asyncit, magic_parallelit, getTable, getRowsTable, \
+    fork_call, sample_stats, repeat_until_precise, fit_complexity, \
+    timer_overhead, load_source, AsyncCall, STATS_HEADER, LATENCY_HEADER, \
+    GC_POLICIES, gc_call
+
+
+class Fixture(object):
+    """
+    Named value shared by several benchmarks.
+
+    A fixture is built at most once per worker process for its scope and
+    injected into the namespace of every benchmark using it, before the
+    benchmark setup runs. Its build time is reported apart from the
+    measurements.
+
+    Parameters
+    ----------
+
+    name: name of the variable the benchmarks see
+    setup: code building the value, which must assign it to ``name``
+    cleanup: code run when the fixture is torn down, with the value bound
+             to ``name``, optional
+    scope: 'suite' to share the value among all the benchmarks, 'module'
+           to share it among the benchmarks defined in the same module,
+           optional
+
+    """
+    def __init__(self, name, setup, cleanup=None, scope='suite'):
+        if scope not in ('suite', 'module'):
+            raise ValueError('unknown fixture scope %r' % scope)
+        self.name = name
+        self.setup = setup
+        self.cleanup = cleanup or ''
+        self.scope = scope
+
+    def __repr__(self):
+        return "Fixture('%s')" % self.name
+
+    @property
+    def checksum(self):
+        return hashlib.md5(self.name + self.setup + self.cleanup +
+                           self.scope).hexdigest()
+
+    def build(self):
+        ns = {}
+        exec self.setup in ns
+        return ns[self.name]
+
+    def teardown(self, value):
+        ns = {self.name: value}
+        exec self.cleanup in ns
+
+
+class ArrayFixture(Fixture):
+    """
+    Fixture holding a numpy array shared by all the benchmark processes.
+
+    The array is built once by :meth:`prepare` and saved to a ``.npy``
+    file, in ``/dev/shm`` when it exists. Every process then maps that
+    file read-only instead of building or unpickling its own copy. The
+    creation time is reported with the fixtures, and the mapping time as
+    their build time.
+
+    Parameters
+    ----------
+
+    name: name of the variable the benchmarks see
+    setup: code building the array, which must assign it to ``name``
+    scope: 'suite' or 'module', see :class:`Fixture`, optional
+    directory: directory of the ``.npy`` file, optional
+
+    """
+    def __init__(self, name, setup, scope='suite', directory=None):
+        Fixture.__init__(self, name, setup, scope=scope)
+        self.directory = directory
+        self.path = None
+        self.creation_time = None
+
+    def prepare(self):
+        """Build the array and write it to its file, unless done already.
+        The file is removed when the process creating it exits."""
+        if self.path is not None:
+            return
+
+        start = time.time()
+        value = np.asarray(Fixture.build(self))
+        directory = self.directory
+        if directory is None:
+            directory = ('/dev/shm' if os.path.isdir('/dev/shm')
+                         else tempfile.gettempdir())
+        fd, path = tempfile.mkstemp(suffix='.npy', dir=directory,
+                                    prefix='benchy-%s-' % self.name)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, value)
+        self.path = path
+        self.creation_time = time.time() - start
+        atexit.register(self.remove)
+
+    def remove(self):
+        """Remove the file of the array."""
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def build(self):
+        self.prepare()
+        return np.load(self.path, mmap_mode='r')
+
+
+def _source(func):
+    """Return the source code of ``func``, or its qualified name when the
+    source is not available."""
+    if func is None:
+        return ''
+    try:
+        return textwrap.dedent(inspect.getsource(func))
+    except (IOError, TypeError):
+        return '%s.%s' % (func.__module__, func.__name__)
+
+
+def _bind(func, args):
+    """Return ``func`` with the arguments ``args`` bound, a tuple of
+    positional arguments, a dict of keyword arguments or None."""
+    if args is None:
+        return func
+    if isinstance(args, dict):
+        return functools.partial(func, **args)
+    return functools.partial(func, *args)
+
+
+def _function_ref(func):
+    """Picklable reference to ``func``: its module, name and source
+    file."""
+    if func is None:
+        return None
+    try:
+        path = inspect.getsourcefile(func)
+    except TypeError:
+        path = None
+    return func.__module__, func.__name__, path
+
+
+def _resolve(ref):
+    """Return the function of a reference made by :func:`_function_ref`,
+    loading its module from the source file when it cannot be imported,
+    like the benchmark files found by discovery or the script run as
+    ``__main__``."""
+    if ref is None:
+        return None
+    module, name, path = ref
+    main = getattr(sys.modules.get('__main__'), '__file__', None)
+    if (module == '__main__' and path is not None and
+            (main is None or
+             os.path.realpath(main) != os.path.realpath(path))):
+        # defined in the script driving the runner, which is not the main
+        # module here: its main block does not run under another name
+        module = '_main_%s' % hashlib.md5(os.path.realpath(path)).hexdigest()
+        if module not in sys.modules:
+            load_source(module, path)
+    if module not in sys.modules:
+        try:
+            __import__(module)
+        except ImportError:
+            if path is None:
+                raise
+            load_source(module, path)
+    return getattr(sys.modules[module], name)
+
+
+class _FixtureCache(object):
+    """The fixtures built by the current process."""
+    def __init__(self):
+        self.values = {}
+
+    def get(self, fixture, module):
+        """Return the value of ``fixture`` for the benchmarks of ``module``
+        and its build time, None if it was already built."""
+        module = module if fixture.scope == 'module' else None
+        if module is not None:
+            # module scoped fixtures of the previous module are done
+            for key in self.values.keys():
+                if key[1] is not None and key[1] != module:
+                    self.teardown(key)
+
+        key = (fixture.checksum, module)
+        if key in self.values:
+            return self.values[key][1], None
+
+        start = time.time()
+        value = fixture.build()
+        self.values[key] = (fixture, value)
+        return value, time.time() - start
+
+    def teardown(self, key=None):
+        """Tear down the fixture stored under ``key``, or all of them."""
+        keys = self.values.keys() if key is None else [key]
+        for key in keys:
+            fixture, value = self.values.pop(key)
+            fixture.teardown(value)
+
+
+_fixture_cache = _FixtureCache()
+atexit.register(_fixture_cache.teardown)
 
 
 class Benchmark(object):
     def __init__(self, code, setup, ncalls=None, repeat=3, cleanup=None,
-       name=None, description=None, logy=False, db_path=None):
+       name=None, description=None, logy=False, db_path=None,
+       target_precision=None, max_time=None, max_repeat=1000,
+       target_time=0.2, timeout=None, allocations=False,
+       allocation_calls=1, fork=False, fixtures=None, module=None,
+       params=None, scale=None, overhead=False,
+       latency=False, latency_calls=10000, coroutine=False,
+       concurrency=(1,), workers=None, tags=None, threshold=None,
+       gc=None):
+        if gc is not None and gc not in GC_POLICIES:
+            raise ValueError('unknown gc policy %r' % gc)
         self.code = code
         self.setup = setup
         self.cleanup = cleanup or ''
         self.ncalls = ncalls
         self.repeat = repeat
+        self.target_precision = target_precision
+        self.max_time = max_time
+        self.max_repeat = max_repeat
+        self.target_time = target_time
+        self.timeout = timeout
+        self.allocations = allocations
+        self.allocation_calls = allocation_calls
+        self.fork = fork
+        self.overhead = overhead
+        self.latency = latency
+        self.latency_calls = latency_calls
+        self.coroutine = coroutine
+        self.concurrency = concurrency
+        self.workers = workers
+        # garbage collector policy, None keeps the default of each
+        # measurement: disabled when timing, enabled otherwise
+        self.gc = gc
 
         self.name = name
         self.description = description
         self.logy = logy
         self.db_path = db_path
+        self.tags = list(tags or [])
+        # relative slowdown tolerated by compare
+        self.threshold = threshold
+
+        self.fixtures = list(fixtures or [])
+        # the fixtures of the suite holding the benchmark, see
+        # BenchmarkSuite.share_fixtures
+        self.suite_fixtures = []
+        if module is None:
+            module = sys._getframe(1).f_globals.get('__name__')
+        self.module = module
+
+        # parameter grid, see expand
+        self.params = params
+        if scale is None and params and len(params) == 1:
+            scale = params.keys()[0]
+        self.scale = scale
+        self.param_values = {}
+        self.parent = None
+
+        # set by from_callable
+        self.func = None
+        self.setup_func = None
+        self.cleanup_func = None
 
     def __repr__(self):
         return "Benchmark('%s')" % self.name
 
+    def __getstate__(self):
+        # the functions of a callable benchmark travel as references
+        state = self.__dict__.copy()
+        for key in ('func', 'setup_func', 'cleanup_func'):
+            state[key] = _function_ref(state.get(key))
+        return state
+
+    def __setstate__(self, state):
+        for key in ('func', 'setup_func', 'cleanup_func'):
+            state[key] = _resolve(state.get(key))
+        self.__dict__.update(state)
+
+    @classmethod
+    def from_callable(cls, func, setup=None, cleanup=None, **kwargs):
+        """Benchmark calling the function ``func`` directly, instead of
+        running a statement in a namespace.
+
+        The functions must be defined at the top level of an importable
+        module, so that the benchmark pickles.
+
+        Parameters
+        ----------
+
+        func: the function measured
+        setup: function called with the fixtures and the parameters of the
+               benchmark as keyword arguments, and returning the arguments
+               of ``func``: a tuple of positional arguments, a dict of
+               keyword arguments or None, optional. By default, ``func``
+               gets the fixtures and the parameters themselves
+        cleanup: function called with the arguments of ``func``, optional
+        kwargs: the other parameters of :class:`Benchmark`, optional
+
+        """
+        kwargs.setdefault('name', func.__name__)
+        kwargs.setdefault('module', func.__module__)
+        bm = cls(_source(func), _source(setup), cleanup=_source(cleanup),
+                 **kwargs)
+        bm.func = func
+        bm.setup_func = setup
+        bm.cleanup_func = cleanup
+        return bm
+
+    def expand(self):
+        """Return one benchmark per point of the parameter grid, or just
+        this benchmark when it has no parameters.
+
+        The parameters of a point are variables of the benchmark
+        namespace, defined before the setup runs."""
+        if not self.params:
+            return [self]
+
+        keys = sorted(self.params)
+        points = []
+        for values in itertools.product(*[self.params[key]
+                                          for key in keys]):
+            point = copy.copy(self)
+            point.params = None
+            point.param_values = dict(zip(keys, values))
+            point.parent = self
+            point.name = '%s[%s]' % (self.name, ', '.join(
+                '%s=%s' % (key, value) for key, value in zip(keys, values)))
+            points.append(point)
+        return points
+
+    def all_fixtures(self):
+        """The fixtures of the benchmark, then those its suite shares
+        with it."""
+        return self.fixtures + [fixture for fixture in self.suite_fixtures
+                                if fixture not in self.fixtures]
+
+    def _build_fixtures(self):
+        """Build the fixtures not built yet by this process, returning the
+        value and build time of each one."""
+        values, build_times = {}, {}
+        for fixture in self.all_fixtures():
+            values[fixture.name], build_times[fixture.name] = \
+                _fixture_cache.get(fixture, self.module)
+        return values, build_times
+
     def _setup(self):
-        ns = globals().copy()
-        exec self.setup in ns
+        if self.func is not None:
+            values = self._build_fixtures()[0]
+            values.update(self.param_values)
+            if self.setup_func is not None:
+                args = self.setup_func(**values)
+            else:
+                args = values or None
+            ns = {'args': args, 'call': _bind(self.func, args)}
+        else:
+            ns = globals().copy()
+            ns.update(self._build_fixtures()[0])
+            ns.update(self.param_values)
+            exec self.setup in ns
+
+        if self.coroutine:
+            stmt = ns['call'] if self.func is not None else self.code
+            ns['_async_call'] = AsyncCall(ns, stmt)
         return ns
 
     @property
     def checksum(self):
-        return hashlib.md5(self.setup + self.code + self.cleanup).hexdigest()
+        params = repr(sorted(self.param_values.items())) \
+            if self.param_values else ''
+        return hashlib.md5(self.setup + self.code + self.cleanup +
+            ''.join(fixture.checksum for fixture in self.all_fixtures()) +
+            params).hexdigest()
+
+    def _statement(self, ns):
+        """The statement measured: the function bound to its arguments for
+        a callable benchmark, the code otherwise. For a coroutine
+        benchmark, a callable awaiting it on an event loop of its own."""
+        if self.coroutine:
+            return ns['_async_call']
+        if self.func is not None:
+            return ns['call']
+        return self.code
 
     def _cleanup(self, ns):
+        if self.coroutine:
+            ns['_async_call'].close()
+        if self.func is not None:
+            if self.cleanup_func is not None:
+                _bind(self.cleanup_func, ns['args'])()
+            return
         exec self.cleanup in ns
 
-    def to_rst(self, results):
-        output = """**Benchmark setup**
+    def _points_to_rst(self, results, stats=False):
+        """Report of a parametrized benchmark, one row per point of the
+        grid, with the complexity classes ranked along ``scale``."""
+        header = ['name', 'repeat', 'timing', 'loops', 'units']
+        if stats:
+            header += STATS_HEADER
+
+        rows, failures = [], []
+        for point, (_, result) in zip(self.expand(), results['points']):
+            runtime = result['runtime']
+            if runtime['success']:
+                runtime['name'] = point.name
+                rows.append(runtime)
+            else:
+                reason = runtime.get('reason') or \
+                    runtime['traceback'].strip().split('\n')[-1]
+                failures.append('  - %s: %s' % (point.name, reason))
+
+        table = getRowsTable(rows, header)
+        if failures:
+            table += '\n\n**Failed points**\n\n%s' % '\n'.join(failures)
+        if 'complexity' in results:
+            table += '\n\n**Complexity along %s**: %s' % (self.scale,
+                ', '.join(fit[0] for fit in results['complexity']))
+
+        return self._rst(table)
+
+    def to_rst(self, results, stats=False):
+        if 'points' in results:
+            return self._points_to_rst(results, stats)
+        header = ['name', 'repeat', 'timing', 'loops', 'units']
+        if 'overhead' in results['runtime']:
+            header += ['overhead', 'corrected_timing']
+        if results['runtime'].get('gc_time') is not None:
+            header += ['gc_collections', 'gc_time']
+        if stats:
+            header += STATS_HEADER
+
+        runtime = results['runtime']
+        if runtime['success']:
+            table = getTable(runtime, self.name, header)
+        else:
+            table = '**Benchmark failed**\n\n::\n\n%s' % indent(
+                runtime.get('reason') or runtime['traceback'])
+
+        if runtime['success'] and 'levels' in runtime:
+            table += '\n\n**Concurrency levels**\n\n%s' % getRowsTable(
+                runtime['levels'], ['concurrency', 'throughput'] +
+                LATENCY_HEADER + ['mean', 'units'])
+
+        allocations = results.get('allocations')
+        if allocations is not None and allocations['success']:
+            table += '\n\n**Memory retained per call**\n\n%s\n\n%s' % (
+                getTable(allocations, self.name,
+                         ['name', 'ncalls', 'retained_blocks',
+                          'retained_bytes', 'peak', 'units']),
+                '\n'.join('  - %s: %.4g B retained in %.4g blocks' % site
+                          for site in allocations['top']))
+
+        parallel = results.get('parallel')
+        if parallel is not None and parallel['success']:
+            table += '\n\n**Parallel scaling**\n\n%s' % getRowsTable(
+                parallel['threads'] + parallel.get('processes', []),
+                ['mode', 'workers', 'throughput', 'latency', 'efficiency'])
+
+        latency = results.get('latency')
+        if latency is not None and latency['success']:
+            table += '\n\n**Latency per call**\n\n%s' % getTable(
+                latency, self.name, ['name', 'ncalls'] + LATENCY_HEADER +
+                ['mean', 'units'])
+
+        return self._rst(table)
+
+    def _rst(self, table):
+        return """**Benchmark setup**
 
 .. code-block:: python
 
@@ -50,38 +501,178 @@ class Benchmark(object):
 
 %s
 """ % (indent(self.setup), indent(self.code),
-        getTable(results['runtime'], self.name,
-                ['name', 'repeat', 'timing', 'loops', 'units']))
-
-        return output
+        table)
 
     def profile(self, ncalls):
         prof = cProfile.Profile()
         ns = self._setup()
 
-        code = compile(self.code, '<f>', 'exec')
+        stmt = self._statement(ns)
+        if callable(stmt):
+            def f(*args, **kwargs):
+                for i in xrange(ncalls):
+                    stmt()
+        else:
+            code = compile(stmt, '<f>', 'exec')
 
-        def f(*args, **kwargs):
-            for i in xrange(ncalls):
-                exec code in ns
+            def f(*args, **kwargs):
+                for i in xrange(ncalls):
+                    exec code in ns
 
-        prof.runcall(f)
+        gc_call(self.gc or 'enabled', prof.runcall, f)
 
         return pstats.Stats(prof).sort_stats('cumulative')
 
-    def run(self):
-        results = {}
-        results['memory'] = self.run_memit()
-        results['runtime'] = self.run_timeit()
+    def run(self, allocations=None, top=10, fork=None, latency=None):
+        """Run the benchmark.
+
+        Parameters
+        ----------
+
+        allocations: also profile ``allocation_calls`` calls with
+                     tracemalloc, optional. Defaults to the
+                     ``allocations`` attribute
+        top: number of allocation sites reported, optional
+        fork: run the setup once and every measurement in a child process
+              forked from it, optional. Defaults to the ``fork`` attribute
+        latency: also time ``latency_calls`` calls one by one, optional.
+                 Defaults to the ``latency`` attribute
+
+        Returns
+        -------
+        results: dict with the 'memory' and 'runtime' results, and the
+                 'allocations', 'latency' and 'parallel' ones when
+                 measured. For a benchmark with parameters, the 'points'
+                 of the grid as (parameters, results) tuples and the
+                 'complexity' classes ranked by how well they fit the
+                 timings along ``scale``
+        """
+        if self.params:
+            points = [(point.param_values,
+                       point.run(allocations, top, fork, latency))
+                      for point in self.expand()]
+            results = {'success': all(result['success']
+                                      for _, result in points),
+                       'points': points}
+            if self.scale is not None:
+                measured = [(values[self.scale], result['runtime']['timing'])
+                            for values, result in points if result['success']]
+                if len(measured) > 2:
+                    results['complexity'] = fit_complexity(*zip(*measured))
+            return results
+
+        if allocations is None:
+            allocations = self.allocations
+        if fork is None:
+            fork = self.fork
+        if latency is None:
+            latency = self.latency
 
+        results = {}
+        fixtures = self.all_fixtures()
+        if fixtures:
+            # built ahead of the measurements, so their cost stays out
+            arrays = [fixture for fixture in fixtures
+                      if isinstance(fixture, ArrayFixture)]
+            for fixture in arrays:
+                fixture.prepare()
+            build_times = self._build_fixtures()[1]
+            results['fixtures'] = {
+                'success': True,
+                'build_time': dict((name, build_time or 0.0)
+                    for name, build_time in build_times.iteritems()),
+                'cached': [name for name, build_time
+                           in build_times.iteritems() if build_time is None],
+                'creation_time': dict((fixture.name, fixture.creation_time)
+                                      for fixture in arrays),
+                'units': 's'}
+
+        ns = self._setup() if fork else None
+
+        results['memory'] = self.run_memit(ns)
+        if self.coroutine:
+            results['runtime'] = self.run_asyncit(ns)
+        else:
+            results['runtime'] = self.run_timeit(ns)
+        if allocations:
+            results['allocations'] = self.run_allocit(top, ns)
+        if latency:
+            results['latency'] = self.run_latency(ns)
+        if self.workers:
+            results['parallel'] = self.run_parallelit(
+                ns, results['runtime'].get('loops'))
+        results['success'] = all(result['success']
+                                 for result in results.values())
+
+        if fork:
+            self._cleanup(ns)
         return results
 
-    def run_timeit(self):
-        ns = self._setup()
+    def _forked_timeit(self, ns):
+        # the first child calibrates the loop count, the others reuse it
+        gc_policy = self.gc or 'disabled'
+        result = fork_call(magic_timeit, ns, self._statement(ns),
+            ncalls=self.ncalls, repeat=1, force_ms=True,
+            target_time=self.target_time, gc_policy=gc_policy)
+        start = time.time()
+
+        def run():
+            sample = fork_call(magic_timeit, ns, self._statement(ns),
+                ncalls=result['loops'], repeat=1, force_ms=True,
+                gc_policy=gc_policy)
+            result['gc_collections'] = [
+                total + count for total, count in
+                zip(result['gc_collections'], sample['gc_collections'])]
+            result['gc_time'] += sample['gc_time']
+            return sample['samples'][0]
+
+        samples = list(result['samples'])
+        while len(samples) < self.repeat:
+            samples.append(run())
+        if self.target_precision is not None:
+            samples = repeat_until_precise(run, samples,
+                self.target_precision, self.max_time, self.max_repeat, start)
+
+        samples = np.array(samples)
+        result.update(sample_stats(samples))
+        result.update({'samples': samples,
+                       'timing': samples.min(),
+                       'repeat': len(samples)})
+        if self.overhead:
+            # in ms, like the forced units of the samples
+            result['overhead'] = 1e3 * timer_overhead(
+                result['loops'], self.repeat, callable(self._statement(ns)))
+            result['corrected_timing'] = max(
+                result['timing'] - result['overhead'], 0.0)
+        return result
+
+    def _forked_memit(self, ns):
+        usages = [fork_call(magic_memit, ns, self._statement(ns),
+                            ncalls=self.ncalls, repeat=1,
+                            gc_policy=self.gc or 'enabled')
+                  for _ in xrange(self.repeat)]
+        result = max(usages, key=lambda usage: usage['peak'])
+        result.update({'usage': max(usage['usage'] for usage in usages),
+                       'repeat': self.repeat})
+        return result
+
+    def run_timeit(self, ns=None):
+        """Time the benchmark. Given the namespace ``ns`` prepared by the
+        setup, every repeat runs in a child process forked from it."""
+        forked = ns is not None
+        if not forked:
+            ns = self._setup()
 
         try:
-            result = magic_timeit(ns, self.code, ncalls=self.ncalls,
-                repeat=self.repeat, force_ms=True)
+            if forked:
+                result = self._forked_timeit(ns)
+            else:
+                result = magic_timeit(ns, self._statement(ns),
+                    ncalls=self.ncalls, repeat=self.repeat, force_ms=True,
+                    target_precision=self.target_precision,
+                    max_time=self.max_time, max_repeat=self.max_repeat,
+                    target_time=self.target_time, overhead=self.overhead,
+                    gc_policy=self.gc or 'disabled')
 
             result['success'] = True
 
@@ -90,15 +681,57 @@ class Benchmark(object):
             traceback.print_exc(file=buf)
             result = {'success': False, 'traceback': buf.getvalue()}
 
-        self._cleanup(ns)
+        if not forked:
+            self._cleanup(ns)
         return result
 
-    def run_memit(self):
-        ns = self._setup()
+    def run_asyncit(self, ns=None):
+        """Time the coroutine of the benchmark at each concurrency level.
+        Given the namespace ``ns`` prepared by the setup, it runs in a
+        child process forked from it."""
+        forked = ns is not None
+        if not forked:
+            ns = self._setup()
+
+        try:
+            factory = ns['_async_call'].factory
+            if forked:
+                result = fork_call(magic_asyncit, ns, factory,
+                    ncalls=self.ncalls or 1000, concurrency=self.concurrency,
+                    repeat=self.repeat)
+            else:
+                result = magic_asyncit(ns, factory,
+                    ncalls=self.ncalls or 1000, concurrency=self.concurrency,
+                    repeat=self.repeat)
+
+            result['success'] = True
 
+        except:
+            buf = StringIO()
+            traceback.print_exc(file=buf)
+            result = {'success': False, 'traceback': buf.getvalue()}
+
+        if not forked:
+            self._cleanup(ns)
+        return result
+
+    def run_parallelit(self, ns=None, ncalls=None):
+        """Measure how the benchmark scales over ``workers`` threads and
+        processes, each one running it ``ncalls`` times, by default the
+        loop count of the timings. Given the namespace ``ns`` prepared by
+        the setup, it runs in a child process forked from it."""
+        forked = ns is not None
+        if not forked:
+            ns = self._setup()
+
+        ncalls = ncalls or self.ncalls or 1000
         try:
-            result = magic_memit(ns, self.code, ncalls=self.ncalls,
-                repeat=self.repeat)
+            if forked:
+                result = fork_call(magic_parallelit, ns, self._statement(ns),
+                    ncalls=ncalls, workers=self.workers)
+            else:
+                result = magic_parallelit(ns, self._statement(ns),
+                    ncalls=ncalls, workers=self.workers)
 
             result['success'] = True
 
@@ -107,23 +740,180 @@ class Benchmark(object):
             traceback.print_exc(file=buf)
             result = {'success': False, 'traceback': buf.getvalue()}
 
-        self._cleanup(ns)
+        if not forked:
+            self._cleanup(ns)
+        return result
+
+    def run_allocit(self, top=10, ns=None):
+        """Profile the allocations of the benchmark. Given the namespace
+        ``ns`` prepared by the setup, it runs in a child process forked
+        from it."""
+        forked = ns is not None
+        if not forked:
+            ns = self._setup()
+
+        try:
+            if forked:
+                result = fork_call(magic_allocit, ns, self._statement(ns),
+                    ncalls=self.allocation_calls, top=top)
+            else:
+                result = magic_allocit(ns, self._statement(ns),
+                    ncalls=self.allocation_calls, top=top)
+
+            result['success'] = True
+
+        except:
+            buf = StringIO()
+            traceback.print_exc(file=buf)
+            result = {'success': False, 'traceback': buf.getvalue()}
+
+        if not forked:
+            self._cleanup(ns)
+        return result
+
+    def run_latency(self, ns=None):
+        """Time the calls of the benchmark one by one. Given the namespace
+        ``ns`` prepared by the setup, it runs in a child process forked
+        from it."""
+        forked = ns is not None
+        if not forked:
+            ns = self._setup()
+
+        try:
+            if forked:
+                result = fork_call(magic_latency, ns, self._statement(ns),
+                    ncalls=self.latency_calls, max_time=self.max_time)
+            else:
+                result = magic_latency(ns, self._statement(ns),
+                    ncalls=self.latency_calls, max_time=self.max_time)
+
+            result['success'] = True
+
+        except:
+            buf = StringIO()
+            traceback.print_exc(file=buf)
+            result = {'success': False, 'traceback': buf.getvalue()}
+
+        if not forked:
+            self._cleanup(ns)
+        return result
+
+    def run_memit(self, ns=None):
+        """Measure the memory usage of the benchmark. Given the namespace
+        ``ns`` prepared by the setup, every repeat runs in a child process
+        forked from it."""
+        forked = ns is not None
+        if not forked:
+            ns = self._setup()
+
+        try:
+            if forked:
+                result = self._forked_memit(ns)
+            else:
+                result = magic_memit(ns, self._statement(ns),
+                    ncalls=self.ncalls, repeat=self.repeat,
+                    gc_policy=self.gc or 'enabled')
+
+            result['success'] = True
+
+        except:
+            buf = StringIO()
+            traceback.print_exc(file=buf)
+            result = {'success': False, 'traceback': buf.getvalue()}
+
+        if not forked:
+            self._cleanup(ns)
         return result
 
 
 class BenchmarkSuite(list):
-    """Basically a list, but the special type is needed for discovery"""
+    """Basically a list, but the special type is needed for discovery.
+
+    The benchmarks share the fixtures of the suite as soon as they are
+    added to it, so that the fixtures are part of their checksums however
+    the benchmarks reach a runner."""
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self.fixtures = []
+        self.share_fixtures()
+
+    def append(self, bm):
+        list.append(self, bm)
+        self.share_fixtures()
+
+    def extend(self, benchmarks):
+        list.extend(self, benchmarks)
+        self.share_fixtures()
+
+    def insert(self, index, bm):
+        list.insert(self, index, bm)
+        self.share_fixtures()
+
+    def __iadd__(self, benchmarks):
+        self.extend(benchmarks)
+        return self
+
+    def __setitem__(self, index, value):
+        list.__setitem__(self, index, value)
+        self.share_fixtures()
+
+    def __setslice__(self, i, j, benchmarks):
+        list.__setslice__(self, i, j, benchmarks)
+        self.share_fixtures()
+
+    def fixture(self, name, setup, cleanup=None, scope='suite'):
+        """Declare a fixture shared by the benchmarks of the suite.
+
+        See :class:`Fixture` for the parameters."""
+        fixture = Fixture(name, setup, cleanup, scope)
+        self.fixtures.append(fixture)
+        return fixture
+
+    def array_fixture(self, name, setup, scope='suite', directory=None):
+        """Declare a numpy array shared read-only by the benchmarks of the
+        suite through a memory-mapped file.
+
+        See :class:`ArrayFixture` for the parameters."""
+        fixture = ArrayFixture(name, setup, scope, directory)
+        self.fixtures.append(fixture)
+        return fixture
+
+    def share_fixtures(self):
+        """Make the fixtures of the suite available to its benchmarks. They
+        see the fixtures declared later too."""
+        for bm in self.benchmarks:
+            bm.suite_fixtures = self.fixtures
+
     @property
     def benchmarks(self):
         """Discard non-benchmark elements of the list"""
         return filter(lambda elem: isinstance(elem, Benchmark), self)
 
 
+def benchmark(func=None, setup=None, cleanup=None, **kwargs):
+    """Decorator declaring a benchmark of the decorated function, with
+    ``@benchmark`` or ``@benchmark(setup=..., ncalls=...)``.
+
+    See :meth:`Benchmark.from_callable` for the parameters. The function
+    is left in place so that it still pickles, and the benchmark is its
+    ``benchmark`` attribute."""
+    def decorate(func):
+        func.benchmark = Benchmark.from_callable(func, setup, cleanup,
+                                                 **kwargs)
+        return func
+
+    if func is not None:
+        return decorate(func)
+    return decorate
+
+
 def gather_benchmarks(ns):
     benchmarks = []
     for v in ns.values():
         if isinstance(v, Benchmark):
             benchmarks.append(v)
+        elif isinstance(getattr(v, 'benchmark', None), Benchmark):
+            benchmarks.append(v.benchmark)
         elif isinstance(v, BenchmarkSuite):
             benchmarks.extend(v.benchmarks)
     return benchmarks
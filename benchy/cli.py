@@ -0,0 +1,138 @@
+"""
+The :mod:`benchy.cli` module is the command line interface of benchy::
+
+    python -m benchy.cli [options] directory
+    python -m benchy.cli --compare [options] baseline candidate
+
+It discovers the benchmarks of the ``bench_*.py`` files of a directory
+tree, and lists or runs those selected. With ``--compare``, it compares
+two result sets saved with ``--save`` instead, and exits with status 1 on
+regressions.
+"""
+import os
+import sys
+import shutil
+import tempfile
+from optparse import OptionParser
+from discovery import BenchmarkIndex
+from compare import compare, regressions, save_results, load_results, \
+    to_rst
+from runner import BenchmarkRunner
+from utils import getAllTable
+
+
+def _compare(options, baseline_path, candidate_path):
+    comparisons = compare(load_results(baseline_path),
+                          load_results(candidate_path), options.alpha,
+                          options.threshold, options.memory_threshold)
+    print to_rst(comparisons)
+    regressed = regressions(comparisons)
+    for comparison in regressed:
+        print >> sys.stderr, 'Benchmark %s regressed.' % comparison['name']
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = OptionParser(usage='Usage: python -m benchy.cli [options] '
+                                '(directory | --compare baseline candidate)')
+    parser.add_option('--list', action='store_true', default=False,
+                      help='list the selected benchmarks instead of '
+                           'running them')
+    parser.add_option('--name', action='append', dest='names',
+                      help='select the benchmark with this name, can be '
+                           'repeated')
+    parser.add_option('-k', '--regex', default=None,
+                      help='select the benchmarks with a name matching '
+                           'this regular expression')
+    parser.add_option('--tag', action='append', dest='tags',
+                      help='select the benchmarks with this tag, can be '
+                           'repeated')
+    parser.add_option('--pattern', default='bench_*.py',
+                      help='glob pattern of the benchmark files')
+    parser.add_option('--index', default=None,
+                      help='index file, by default in the directory')
+    parser.add_option('--db', default=None,
+                      help='SQLite database where the results are stored')
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='number of benchmarks run in parallel')
+    parser.add_option('--checkpoint', default=None,
+                      help='stream the results to this JSON lines file')
+    parser.add_option('--resume', action='store_true', default=False,
+                      help='skip the benchmarks which succeeded in the '
+                           'checkpoint')
+    parser.add_option('--rounds', type='int', default=None,
+                      help='interleave the benchmarks over this many rounds '
+                           'in random order')
+    parser.add_option('--seed', type='int', default=None,
+                      help='seed of the order of the rounds')
+    parser.add_option('--preflight', type='choice',
+                      choices=['warn', 'refuse'], default=None,
+                      help='warn or refuse to run on a noisy machine')
+    parser.add_option('--save', default=None,
+                      help='save the results to this file')
+    parser.add_option('--compare', action='store_true', default=False,
+                      help='compare two saved result sets')
+    parser.add_option('--alpha', type='float', default=0.05,
+                      help='significance level of the comparison')
+    parser.add_option('--threshold', type='float', default=0.05,
+                      help='relative slowdown tolerated by the comparison')
+    parser.add_option('--memory-threshold', type='float', default=1.0,
+                      help='memory growth in MB tolerated by the '
+                           'comparison')
+    options, args = parser.parse_args(argv)
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error('expected a baseline and a candidate')
+        return _compare(options, *args)
+
+    if len(args) != 1:
+        parser.error('expected one directory')
+
+    index = BenchmarkIndex(args[0], options.index, options.pattern)
+    index.update()
+    for path, error in sorted(index.errors().iteritems()):
+        print >> sys.stderr, 'Could not import %s:\n%s' % (path, error)
+
+    selected = index.select(options.names, options.regex, options.tags)
+    if options.list:
+        for path, entry in selected:
+            tags = ' [%s]' % ', '.join(entry['tags']) if entry['tags'] else ''
+            print '%s::%s%s' % (os.path.relpath(path, index.directory),
+                                entry['name'], tags)
+        return 0
+
+    if not selected:
+        print 'No benchmark selected.'
+        return 0
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        runner = BenchmarkRunner(index.load(selected), tmp_dir,
+                                 name=os.path.basename(index.directory),
+                                 jobs=options.jobs, db_path=options.db,
+                                 python_path=index.python_path(selected),
+                                 checkpoint=options.checkpoint,
+                                 resume=options.resume,
+                                 rounds=options.rounds, seed=options.seed,
+                                 preflight=options.preflight)
+        n_benchs, results = runner.run()
+        if runner.seed is not None:
+            print 'Rounds shuffled with seed %d' % runner.seed
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if options.save is not None:
+        save_results(results, options.save)
+
+    print getAllTable(results, ['name', 'repeat', 'timing', 'loops', 'units',
+                                'timeBaselines'])
+    failed = [bm.name for bm, result in results.iteritems()
+              if not result['runtime']['success']]
+    for name in failed:
+        print >> sys.stderr, 'Benchmark %s failed.' % name
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+The :mod:`benchy.compare` module compares the results of two runs of a
+suite, to find the benchmarks which got significantly slower or faster.
+"""
+import cPickle as pickle
+from collections import namedtuple, OrderedDict
+import numpy as np
+from utils import mann_whitney_u, min_p_value, getRowsTable
+
+
+COMPARE_HEADER = ['name', 'baseline', 'candidate', 'units', 'ratio',
+                  'p_value', 'status', 'memory_growth', 'memory_status']
+
+# what a saved result set keeps of each benchmark
+ResultKey = namedtuple('ResultKey', ['name', 'checksum', 'threshold'])
+
+
+def save_results(results, path):
+    """Save the results of a run to ``path``, keyed by the name, checksum
+    and threshold of each benchmark, so that loading them does not need
+    the benchmark code."""
+    saved = OrderedDict()
+    for bm, result in results.iteritems():
+        saved[ResultKey(bm.name, bm.checksum,
+                        getattr(bm, 'threshold', None))] = result
+    with open(path, 'wb') as f:
+        pickle.dump(saved, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_results(path):
+    """Load results saved by :func:`save_results`."""
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _match(baseline, candidate):
+    """Pair the benchmarks of two result sets by checksum, then by name
+    for those left over."""
+    by_checksum = dict((bm.checksum, bm) for bm in baseline)
+    by_name = dict((bm.name, bm) for bm in baseline)
+    pairs, matched = [], set()
+    for bm in candidate:
+        base = by_checksum.get(bm.checksum)
+        if base is None or base in matched:
+            base = by_name.get(bm.name)
+        if base is None or base in matched:
+            continue
+        matched.add(base)
+        pairs.append((base, bm))
+    return pairs
+
+
+def compare(baseline, candidate, alpha=0.05, threshold=0.05,
+            memory_threshold=1.0):
+    """Compare a candidate run of benchmarks against a baseline run.
+
+    A benchmark regressed when its timing samples differ significantly
+    between the runs, by a Mann-Whitney U test, and its median timing grew
+    by more than its threshold. It improved in the opposite case.
+
+    When there are too few samples for the test to ever reach ``alpha``,
+    or a run kept no samples, the threshold alone decides, and a change
+    within it is reported as 'insufficient samples' rather than
+    'unchanged'.
+
+    Parameters
+    ----------
+
+    baseline: mapping of the benchmarks of the baseline run to their
+              results, as returned by BenchmarkRunner.run
+    candidate: mapping of the benchmarks of the candidate run to their
+               results
+    alpha: significance level of the test, optional
+    threshold: relative change of the median timing below which a change
+               is ignored, optional. The ``threshold`` of a benchmark
+               takes precedence
+    memory_threshold: growth of the memory usage in MB above which the
+                      memory regressed, optional
+
+    Returns
+    -------
+    comparisons: list of dicts with the 'name', 'checksum', median
+                 'baseline' and 'candidate' timings in 'units', their
+                 'ratio', the 'p_value' of the test, the 'status' among
+                 'regression', 'improvement', 'unchanged',
+                 'insufficient samples', 'failed' and 'baseline failed',
+                 the 'memory_growth' in MB and the 'memory_status'. The
+                 largest slowdowns come first
+    """
+    comparisons = []
+    for base, bm in _match(baseline, candidate):
+        base_result, result = baseline[base], candidate[bm]
+        comparison = dict.fromkeys(COMPARE_HEADER)
+        comparison.update({'name': bm.name, 'checksum': bm.checksum})
+
+        base_runtime, runtime = base_result['runtime'], result['runtime']
+        if not runtime['success']:
+            comparison.update({'status': 'failed', 'ratio': float('inf')})
+            comparisons.append(comparison)
+            continue
+        if not base_runtime['success']:
+            comparison.update({'status': 'baseline failed'})
+            comparisons.append(comparison)
+            continue
+
+        limit = getattr(bm, 'threshold', None)
+        if limit is None:
+            limit = threshold
+        if 'samples' in base_runtime and 'samples' in runtime:
+            base_timing = np.median(base_runtime['samples'])
+            timing = np.median(runtime['samples'])
+            p_value = mann_whitney_u(base_runtime['samples'],
+                                     runtime['samples'])[1]
+            testable = min_p_value(len(base_runtime['samples']),
+                                   len(runtime['samples'])) < alpha
+        else:
+            base_timing, timing = base_runtime['timing'], runtime['timing']
+            p_value, testable = None, False
+        ratio = timing / base_timing
+
+        if testable:
+            significant, status = p_value < alpha, 'unchanged'
+        else:
+            significant, status = True, 'insufficient samples'
+        if significant and ratio > 1 + limit:
+            status = 'regression'
+        elif significant and ratio < 1 - limit:
+            status = 'improvement'
+        comparison.update({'baseline': base_timing,
+                           'candidate': timing,
+                           'units': runtime['units'],
+                           'ratio': ratio,
+                           'p_value': p_value,
+                           'status': status})
+
+        base_memory, memory = base_result['memory'], result['memory']
+        if base_memory['success'] and memory['success']:
+            growth = memory['usage'] - base_memory['usage']
+            comparison.update({
+                'memory_growth': growth,
+                'memory_status': ('regression' if growth > memory_threshold
+                                  else 'unchanged')})
+        comparisons.append(comparison)
+
+    return sorted(comparisons, key=lambda comparison: comparison['ratio'],
+                  reverse=True)
+
+
+def regressions(comparisons):
+    """Return the comparisons showing a slowdown, a failure or a memory
+    growth."""
+    return [comparison for comparison in comparisons
+            if comparison['status'] in ('regression', 'failed') or
+            comparison['memory_status'] == 'regression']
+
+
+def to_rst(comparisons):
+    """Table of the comparisons."""
+    return getRowsTable(comparisons, COMPARE_HEADER)
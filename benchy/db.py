@@ -0,0 +1,163 @@
+"""
+The :mod:`benchy.db` module stores benchmark results in a SQLite database.
+"""
+import time
+import json
+import sqlite3
+import cPickle as pickle
+from utils import get_environment, environment_checksum
+
+
+class BenchmarkDB(object):
+    """
+    Results database, with one row per benchmark run.
+
+    Runs are keyed by the benchmark checksum and the checksum of the
+    environment they ran in, so results from different machines or
+    interpreters never get mixed.
+
+    Parameters
+    ----------
+
+    db_path: path of the SQLite database file
+
+    """
+    _schema = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    checksum TEXT NOT NULL,
+    name TEXT,
+    environment TEXT NOT NULL,
+    fingerprint TEXT,
+    revision TEXT,
+    timestamp REAL NOT NULL,
+    success INTEGER NOT NULL,
+    timing REAL,
+    units TEXT,
+    memory REAL,
+    samples BLOB,
+    result BLOB
+);
+CREATE INDEX IF NOT EXISTS results_lookup
+    ON results (checksum, environment, timestamp);
+CREATE INDEX IF NOT EXISTS results_revision
+    ON results (checksum, revision);
+"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = self._connect()
+        try:
+            conn.executescript(self._schema)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # one short-lived connection per call, so the database can be
+        # shared by the runner threads
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def write_result(self, bm, result, env=None, timestamp=None,
+                     revision=None, fingerprint=None):
+        """Store the ``result`` of one run of the benchmark ``bm``,
+        optionally measured on the given ``revision`` of the code under
+        test. The ``fingerprint`` of the run, by default its environment,
+        is stored along."""
+        if env is None:
+            env = get_environment()
+        if fingerprint is None:
+            fingerprint = env
+        if timestamp is None:
+            timestamp = time.time()
+
+        runtime = result.get('runtime', {})
+        memory = result.get('memory', {})
+        success = bool(runtime.get('success') and memory.get('success'))
+        samples = runtime.get('samples')
+        if samples is not None:
+            samples = sqlite3.Binary(pickle.dumps(samples,
+                                                  pickle.HIGHEST_PROTOCOL))
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT INTO results (checksum, name, environment, '
+                    'fingerprint, revision, timestamp, success, timing, '
+                    'units, memory, samples, result) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (bm.checksum, bm.name, environment_checksum(env),
+                     json.dumps(fingerprint, sort_keys=True), revision,
+                     timestamp,
+                     int(success), runtime.get('timing'),
+                     runtime.get('units'), memory.get('usage'), samples,
+                     sqlite3.Binary(pickle.dumps(
+                         result, pickle.HIGHEST_PROTOCOL))))
+        finally:
+            conn.close()
+
+    def get_results(self, checksum, env=None, max_age=None,
+                    only_success=True, revision=None):
+        """Return the stored runs of a benchmark, newest first.
+
+        Parameters
+        ----------
+
+        checksum: checksum of the benchmark
+        env: environment the runs must come from, optional. Defaults to
+             the current one
+        max_age: only return runs younger than this many seconds, optional
+        only_success: discard failed runs, optional
+        revision: only return runs measured on this revision of the code
+                  under test, optional
+
+        Returns
+        -------
+        runs: list of dicts with the 'timestamp', 'environment',
+              'fingerprint', 'revision', 'samples' and 'result' of each
+              run
+        """
+        if env is None:
+            env = get_environment()
+
+        query = ('SELECT timestamp, environment, fingerprint, revision, '
+                 'samples, result FROM results WHERE checksum = ? '
+                 'AND environment = ?')
+        args = [checksum, environment_checksum(env)]
+        if revision is not None:
+            query += ' AND revision = ?'
+            args.append(revision)
+        if max_age is not None:
+            query += ' AND timestamp >= ?'
+            args.append(time.time() - max_age)
+        if only_success:
+            query += ' AND success = 1'
+        query += ' ORDER BY timestamp DESC'
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, args).fetchall()
+        finally:
+            conn.close()
+
+        runs = []
+        for (timestamp, environment, fingerprint, revision, samples,
+             result) in rows:
+            runs.append({
+                'timestamp': timestamp,
+                'environment': environment,
+                'fingerprint': json.loads(fingerprint),
+                'revision': revision,
+                'samples': (pickle.loads(str(samples))
+                            if samples is not None else None),
+                'result': pickle.loads(str(result))})
+        return runs
+
+    def get_latest_result(self, checksum, env=None, max_age=None,
+                          revision=None):
+        """Return the results of the newest successful run of a benchmark,
+        or None if there is no such run."""
+        runs = self.get_results(checksum, env, max_age, revision=revision)
+        if not runs:
+            return None
+        return runs[0]['result']
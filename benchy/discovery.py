@@ -0,0 +1,142 @@
+"""
+The :mod:`benchy.discovery` module finds the benchmarks defined in a
+directory tree, without importing the files that did not change.
+"""
+import os
+import re
+import sys
+import json
+import fnmatch
+import traceback
+from benchmark import gather_benchmarks
+from utils import load_source
+
+
+class BenchmarkIndex(object):
+    """
+    Index of the benchmarks defined by the files of a directory tree.
+
+    The name, checksum and tags of the benchmarks of each file are kept in
+    a JSON file along with the modification time of the file, so that a
+    file is only imported again once it changed. Listing and selecting
+    benchmarks only reads the index, and loading them imports the files
+    defining the selected ones.
+
+    Parameters
+    ----------
+
+    directory: root of the tree of benchmark files
+    index_path: JSON file of the index, optional. Defaults to
+                ``.benchy-index.json`` in ``directory``
+    pattern: glob pattern of the benchmark file names, optional
+
+    """
+    def __init__(self, directory, index_path=None, pattern='bench_*.py'):
+        self.directory = os.path.abspath(directory)
+        if index_path is None:
+            index_path = os.path.join(self.directory, '.benchy-index.json')
+        self.index_path = index_path
+        self.pattern = pattern
+        self.files = {}
+        if os.path.exists(index_path):
+            self.files = json.load(open(index_path))
+
+    def paths(self):
+        """Return the benchmark files of the tree, sorted."""
+        paths = []
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            paths.extend(os.path.join(root, name) for name in
+                         fnmatch.filter(sorted(files), self.pattern))
+        return paths
+
+    def module_name(self, path):
+        """Name of the module of the file at ``path``, its path relative
+        to the directory, so that files of the same name in different
+        directories do not replace each other."""
+        relative = os.path.relpath(os.path.splitext(path)[0], self.directory)
+        return relative.replace(os.sep, '.')
+
+    def _import(self, path):
+        """Import the file at ``path``, its directory going on the import
+        path while it runs."""
+        saved = list(sys.path)
+        sys.path.insert(0, os.path.dirname(path))
+        try:
+            return load_source(self.module_name(path), path)
+        finally:
+            sys.path[:] = saved
+
+    def _scan(self, path):
+        mtime = os.path.getmtime(path)
+        try:
+            module = self._import(path)
+        except Exception:
+            return {'mtime': mtime, 'benchmarks': [],
+                    'error': traceback.format_exc()}
+        return {'mtime': mtime,
+                'benchmarks': [{'name': bm.name,
+                                'checksum': bm.checksum,
+                                'tags': bm.tags}
+                               for bm in gather_benchmarks(vars(module))]}
+
+    def update(self):
+        """Import the new and modified files, forget the removed ones and
+        save the index.
+
+        Returns
+        -------
+        scanned: paths of the files imported
+        """
+        files, scanned = {}, []
+        for path in self.paths():
+            entry = self.files.get(path)
+            if entry is None or entry['mtime'] != os.path.getmtime(path):
+                entry = self._scan(path)
+                scanned.append(path)
+            files[path] = entry
+        self.files = files
+
+        with open(self.index_path, 'w') as f:
+            json.dump(files, f, indent=1, sort_keys=True)
+        return scanned
+
+    def errors(self):
+        """Return the traceback of each file which failed to import."""
+        return dict((path, entry['error'])
+                    for path, entry in self.files.iteritems()
+                    if 'error' in entry)
+
+    def select(self, names=None, regex=None, tags=None):
+        """Return the indexed benchmarks as (path, entry) tuples, in file
+        order, keeping those with one of ``names``, with a name matching
+        ``regex`` and with all the ``tags``, each filter being optional."""
+        if regex is not None:
+            regex = re.compile(regex)
+        selected = []
+        for path in sorted(self.files):
+            for entry in self.files[path]['benchmarks']:
+                if names and entry['name'] not in names:
+                    continue
+                if regex is not None and not regex.search(entry['name']):
+                    continue
+                if tags and not set(tags).issubset(entry['tags']):
+                    continue
+                selected.append((path, entry))
+        return selected
+
+    def load(self, selected):
+        """Import the files of the ``selected`` benchmarks and return
+        these benchmarks."""
+        checksums = set(entry['checksum'] for _, entry in selected)
+        benchmarks = []
+        for path in sorted(set(path for path, _ in selected)):
+            module = self._import(path)
+            benchmarks.extend(bm for bm in gather_benchmarks(vars(module))
+                              if bm.checksum in checksums)
+        return benchmarks
+
+    def python_path(self, selected):
+        """Directories the benchmark processes need on their import path
+        for the ``selected`` benchmarks."""
+        return sorted(set(os.path.dirname(path) for path, _ in selected))
@@ -0,0 +1,129 @@
+"""
+The :mod:`benchy.revisions` module runs benchmarks against the history of
+a git repository, in the spirit of vbench.
+"""
+import os
+import subprocess
+from collections import OrderedDict
+from db import BenchmarkDB
+from runner import BenchmarkRunner
+from utils import get_environment
+
+
+class RevisionRunner(object):
+    """
+    Runs a suite of benchmarks on several commits of the code under test.
+
+    Each commit is checked out into a worktree that is reused from one
+    commit to the next, built once, and the benchmarks are run with the
+    worktree first on the import path. Results are stored per (commit,
+    benchmark checksum), and the pairs already measured in the current
+    environment are skipped, so the history can be filled in
+    incrementally.
+
+    Parameters
+    ----------
+
+    benchmarks: list of Benchmark objects
+    repo_path: path of the git repository of the code under test
+    tmp_dir: directory for the worktree and the scratch files
+    db_path: SQLite database where the results are stored
+    build_cmd: shell command building the code inside the worktree,
+               optional
+    name: name of the suite, optional
+    kwargs: extra options passed to each BenchmarkRunner, optional
+
+    """
+    def __init__(self, benchmarks, repo_path, tmp_dir, db_path,
+                 build_cmd=None, name='', **kwargs):
+        self.benchmarks = benchmarks
+        self.repo_path = os.path.abspath(repo_path)
+        self.tmp_dir = tmp_dir
+        self.db = BenchmarkDB(db_path)
+        self.build_cmd = build_cmd
+        self.name = name
+        self.runner_options = kwargs
+        self.worktree = os.path.abspath(os.path.join(tmp_dir, 'worktree'))
+
+    def _git(self, *args, **kwargs):
+        cwd = kwargs.pop('cwd', self.repo_path)
+        return subprocess.check_output(('git',) + args, cwd=cwd).strip()
+
+    def revisions(self, start, end='HEAD'):
+        """Return the commits after ``start`` up to ``end``, oldest
+        first."""
+        out = self._git('rev-list', '--reverse', '%s..%s' % (start, end))
+        return out.split()
+
+    def checkout(self, revision):
+        """Check ``revision`` out into the worktree and build it.
+
+        Returns False if the build failed."""
+        revision = self._git('rev-parse', revision)
+        if not os.path.exists(self.worktree):
+            self._git('worktree', 'add', '--detach', self.worktree, revision)
+        else:
+            self._git('checkout', '--quiet', '--force', '--detach', revision,
+                      cwd=self.worktree)
+            # no build products of the previous commit may leak in
+            self._git('clean', '-q', '-f', '-d', '-x', cwd=self.worktree)
+
+        if self.build_cmd is None:
+            return True
+
+        print 'Building %s ...' % revision
+        retcode = subprocess.call(self.build_cmd, shell=True,
+                                  cwd=self.worktree)
+        if retcode != 0:
+            print 'Build of %s exited with code %d.' % (revision, retcode)
+            return False
+        return True
+
+    def pending(self, revision, env=None):
+        """Return the benchmarks not measured yet on ``revision``, one per
+        point of the parameter grids, as the results are stored."""
+        return [point for bm in self.benchmarks for point in bm.expand()
+                if self.db.get_latest_result(point.checksum, env,
+                                             revision=revision) is None]
+
+    def run(self, revisions):
+        """Run the benchmarks on each one of ``revisions``.
+
+        Returns
+        -------
+        results: OrderedDict mapping each commit to the results of the
+                 benchmarks run on it
+        """
+        env = get_environment()
+        results = OrderedDict()
+        for revision in revisions:
+            revision = self._git('rev-parse', revision)
+            benchmarks = self.pending(revision, env)
+            if not benchmarks:
+                print 'Skipping %s, already measured' % revision
+                continue
+
+            if not self.checkout(revision):
+                continue
+
+            # the runner stores the results, once, along with the revision
+            options = dict(self.runner_options)
+            options.update({'python_path': [self.worktree],
+                            'db_path': self.db.db_path,
+                            'revision': revision,
+                            'repo_path': self.worktree})
+            runner = BenchmarkRunner(benchmarks, self.tmp_dir, self.name,
+                                     **options)
+            n_benchs, results[revision] = runner.run()
+
+        return results
+
+    def history(self, bm, revisions):
+        """Return the stored results of ``bm`` for each one of
+        ``revisions``, None where it was not measured."""
+        history = OrderedDict()
+        for revision in revisions:
+            revision = self._git('rev-parse', revision)
+            history[revision] = self.db.get_latest_result(bm.checksum,
+                                                          revision=revision)
+        return history
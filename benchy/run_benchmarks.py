@@ -1,12 +1,88 @@
+import os
 import sys
+import math
+import resource
 import cPickle as pickle
+from optparse import OptionParser
+
+from utils import set_cpu_affinity
+
+
+def limit_memory(megabytes):
+    """Limit the address space of the process to ``megabytes``."""
+    nbytes = int(megabytes * 2 ** 20)
+    resource.setrlimit(resource.RLIMIT_AS, (nbytes, nbytes))
+
+
+def limit_cpu(seconds):
+    """Let the process use ``seconds`` more seconds of CPU time, after
+    which it gets a SIGXCPU."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    soft = int(math.ceil(used + seconds))
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def serve(stdin, stdout, rlimit_cpu=None):
+    """Run the benchmarks read from ``stdin`` until end of input, writing
+    each result along with the current resident memory to ``stdout``."""
+    from memory_profiler import memory_usage
+
+    while True:
+        try:
+            benchmark = pickle.load(stdin)
+        except EOFError:
+            break
+
+        if rlimit_cpu is not None:
+            # the CPU limit applies to every benchmark, not to the
+            # lifetime of the worker
+            limit_cpu(rlimit_cpu)
+
+        res = benchmark.run()
+
+        pickle.dump((res, memory_usage()[0]), stdout,
+                    pickle.HIGHEST_PROTOCOL)
+        stdout.flush()
+
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print 'Usage: script.py input output'
+    parser = OptionParser(
+        usage='Usage: script.py [--cpu N] (input output | --worker)')
+    parser.add_option('--cpu', type='int', default=None,
+                      help='pin the benchmark process to this CPU')
+    parser.add_option('--worker', action='store_true', default=False,
+                      help='serve benchmarks over stdin/stdout')
+    parser.add_option('--rlimit-as', type='float', default=None,
+                      help='address space limit in MB')
+    parser.add_option('--rlimit-cpu', type='float', default=None,
+                      help='CPU time limit of each benchmark in seconds')
+    options, args = parser.parse_args()
+
+    if len(args) != (0 if options.worker else 2):
+        print parser.get_usage()
         sys.exit()
 
-    in_path, out_path = sys.argv[1:]
+    if options.cpu is not None:
+        set_cpu_affinity([options.cpu])
+    if options.rlimit_as is not None:
+        limit_memory(options.rlimit_as)
+
+    if options.worker:
+        # results travel over the original stdout, anything the
+        # benchmarks print goes to stderr instead
+        out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        serve(sys.stdin, out, options.rlimit_cpu)
+        sys.exit()
+
+    if options.rlimit_cpu is not None:
+        limit_cpu(options.rlimit_cpu)
+
+    in_path, out_path = args
     benchmark = pickle.load(open(in_path))
 
     res = benchmark.run()
@@ -1,9 +1,426 @@
 import os
+import sys
+import copy
+import json
+import time
+import base64
 import pickle
+import signal
+import Queue
+import warnings
+import threading
 import subprocess
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 import numpy as np
-from utils import getAllTable
+from db import BenchmarkDB
+from utils import getAllTable, get_cpu_affinity, get_environment, \
+    get_fingerprint, environment_checksum, measure_noise, fit_complexity, \
+    sample_stats, STATS_HEADER
+
+
+def _failure(reason):
+    """Results of a benchmark that could not run to completion."""
+    return {'success': False,
+            'reason': reason,
+            'memory': {'success': False, 'reason': reason},
+            'runtime': {'success': False, 'reason': reason}}
+
+
+def _successful(results):
+    """Discard the failed benchmarks from ``results``."""
+    return OrderedDict((bm, result) for bm, result in results.iteritems()
+                       if result['runtime']['success'] and
+                       result['memory']['success'])
+
+
+def _encode(value):
+    """Turn results into JSON values. Tuples and numpy arrays are tagged
+    so that :func:`_decode` restores them, other objects are pickled."""
+    if isinstance(value, dict):
+        return dict((key, _encode(item)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(item) for item in value]}
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, long, float,
+                                           basestring)):
+        return value
+    return {'__pickle__': base64.b64encode(
+        pickle.dumps(value, pickle.HIGHEST_PROTOCOL))}
+
+
+def _decode(value):
+    if '__tuple__' in value:
+        return tuple(value['__tuple__'])
+    if '__ndarray__' in value:
+        return np.array(value['__ndarray__'], dtype=value['dtype'])
+    if '__pickle__' in value:
+        return pickle.loads(base64.b64decode(value['__pickle__']))
+    return value
+
+
+def _merge_rounds(results):
+    """Results of a benchmark run over several rounds, with the timing
+    samples of all the rounds, or the first failure."""
+    for result in results:
+        if not (result['runtime']['success'] and
+                result['memory']['success']):
+            return result
+
+    samples = np.concatenate([result['runtime']['samples']
+                              for result in results])
+    runtime = dict(results[0]['runtime'])
+    runtime.update(sample_stats(samples))
+    runtime.update({'samples': samples,
+                    'timing': samples.min(),
+                    'repeat': len(samples),
+                    'rounds': len(results)})
+    if 'overhead' in runtime:
+        runtime['overhead'] = min(result['runtime']['overhead']
+                                  for result in results)
+        runtime['corrected_timing'] = max(
+            runtime['timing'] - runtime['overhead'], 0.0)
+    if runtime.get('gc_collections') is not None:
+        runtime['gc_collections'] = [
+            sum(counts) for counts in
+            zip(*[result['runtime']['gc_collections'] for result in results])]
+        runtime['gc_time'] = sum(result['runtime']['gc_time']
+                                 for result in results)
+    merged = dict(results[-1])
+    merged.update({'runtime': runtime,
+                   'memory': max([result['memory'] for result in results],
+                                 key=lambda memory: memory['usage'])})
+    return merged
+
+
+class _Checkpoint(object):
+    """
+    Append-only JSON lines file with the results of the benchmarks, one
+    line written as soon as each benchmark finished.
+
+    Parameters
+    ----------
+
+    path: path of the file
+    env: environment of the run, see :func:`get_environment`. Results
+         measured in another environment are ignored
+    resume: keep the results already in the file, optional. Otherwise the
+            file starts empty
+
+    """
+    def __init__(self, path, env, resume=False):
+        self.path = path
+        self.environment = environment_checksum(env)
+        self._lock = threading.Lock()
+        if not resume or not os.path.exists(path):
+            open(path, 'w').close()
+            return
+
+        # drop the line being written when the run was killed
+        with open(path, 'r+') as f:
+            content = f.read()
+            f.truncate(content.rfind('\n') + 1)
+
+    @staticmethod
+    def key(bm):
+        """Key of the results of ``bm`` in :meth:`read`. The checksum
+        leaves out the options of the run, so the name tells apart the
+        benchmarks of the same code."""
+        # as read back, whether the name was bytes or unicode
+        return json.dumps([bm.checksum, bm.name])
+
+    def _records(self):
+        with open(self.path) as f:
+            for line in f:
+                record = json.loads(line, object_hook=_decode)
+                if record.get('environment_checksum') == self.environment:
+                    yield record
+
+    def read(self):
+        """Return the results in the file measured in the environment of
+        the run by :meth:`key`, the last one of a benchmark winning."""
+        results = {}
+        for record in self._records():
+            if record.get('round') is None:
+                key = json.dumps([record['checksum'], record['name']])
+                results[key] = record['result']
+        return results
+
+    def read_rounds(self):
+        """Return the results of the single rounds in the file, see
+        :meth:`write`, by :meth:`key` and then by round."""
+        results = {}
+        for record in self._records():
+            if record.get('round') is not None:
+                key = json.dumps([record['checksum'], record['name']])
+                results.setdefault(key, {})[record['round']] = \
+                    record['result']
+        return results
+
+    def write(self, bm, result, round_=None):
+        """Append the ``result`` of ``bm``, or of its round ``round_`` only
+        when the benchmark runs over several rounds."""
+        line = json.dumps({'checksum': bm.checksum, 'name': bm.name,
+                           'environment_checksum': self.environment,
+                           'round': round_,
+                           'result': _encode(result)})
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _start_process(cmd, **kwargs):
+    """Start ``cmd`` in a session of its own, so that :func:`_kill` also
+    reaches the processes the benchmark forks."""
+    if hasattr(os, 'setsid'):
+        kwargs['preexec_fn'] = os.setsid
+    return subprocess.Popen(cmd, **kwargs)
+
+
+def _kill(proc):
+    """Kill ``proc`` and the processes of its session."""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+class _Watchdog(object):
+    """Kills ``proc``, and whatever it forked, if it is still running after
+    ``timeout`` seconds."""
+    def __init__(self, proc, timeout=None):
+        self.proc = proc
+        self.timeout = timeout
+        self.fired = False
+        self.timer = None
+        if timeout is not None:
+            self.timer = threading.Timer(timeout, self._kill)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _kill(self):
+        self.fired = True
+        _kill(self.proc)
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer.join()
+
+    def reason(self, returncode):
+        """Explain why a benchmark process ended with ``returncode``."""
+        if self.fired:
+            return 'timed out after %g s' % self.timeout
+        if (hasattr(signal, 'SIGXCPU') and
+                returncode == -signal.SIGXCPU):
+            return 'CPU time limit exceeded'
+        if returncode < 0:
+            return 'killed by signal %d' % -returncode
+        return 'exited with code %d' % returncode
+
+
+class _Worker(object):
+    """
+    Runs benchmarks one at a time, each in a fresh interpreter.
+
+    Every worker owns its scratch files inside ``tmp_dir``, so several
+    workers (or several runners) can safely share the same directory.
+
+    Parameters
+    ----------
+
+    tmp_dir: directory for the scratch files
+    worker_id: number of the worker inside the runner
+    cpu: CPU the benchmark processes are pinned to, optional
+    python_path: directories put first on the import path of the
+                 benchmark processes, optional
+    rlimit_as: address space limit of the benchmark processes in MB,
+               optional
+    rlimit_cpu: CPU time limit of each benchmark in seconds, optional
+
+    """
+    def __init__(self, tmp_dir, worker_id=0, cpu=None, python_path=None,
+                 rlimit_as=None, rlimit_cpu=None):
+        self.tmp_dir = tmp_dir
+        self.cpu = cpu
+        self.python_path = python_path or []
+        self.rlimit_as = rlimit_as
+        self.rlimit_cpu = rlimit_cpu
+
+        prefix = 'benchy-%d-%d' % (os.getpid(), worker_id)
+        self.pickle_path = os.path.join(tmp_dir, prefix + '-benchmark.pickle')
+        self.results_path = os.path.join(tmp_dir, prefix + '-results.pickle')
+
+    def _command(self, *args):
+        cmd = [sys.executable,
+               os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'run_benchmarks.py')]
+        if self.cpu is not None:
+            cmd.append('--cpu=%d' % self.cpu)
+        if self.rlimit_as is not None:
+            cmd.append('--rlimit-as=%g' % self.rlimit_as)
+        if self.rlimit_cpu is not None:
+            cmd.append('--rlimit-cpu=%g' % self.rlimit_cpu)
+        return cmd + list(args)
+
+    def _environ(self):
+        # the child must be able to unpickle the benchmark, so it gets
+        # the same import path as this process
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.path.abspath(path)
+             for path in list(self.python_path) + sys.path])
+        return env
+
+    def run(self, bm, timeout=None):
+        """Run ``bm``, killing it after ``timeout`` seconds, and return its
+        results."""
+        print 'Running benchmark %s ...' % bm.name
+
+        if os.path.exists(self.results_path):
+            os.remove(self.results_path)
+
+        pickle.dump(bm, open(self.pickle_path, 'wb'))
+
+        cmd = self._command(self.pickle_path, self.results_path)
+        print ' '.join(cmd)
+        proc = _start_process(cmd, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE,
+                              cwd=self.tmp_dir,
+                              env=self._environ())
+        watchdog = _Watchdog(proc, timeout)
+        try:
+            stdout, stderr = proc.communicate()
+        except BaseException:
+            # out of the session of this process, nothing else stops it
+            _kill(proc)
+            raise
+        finally:
+            watchdog.cancel()
+
+        print 'stdout: %s' % stdout
+
+        if stderr:
+            if ("object has no attribute" in stderr or
+            'ImportError' in stderr):
+                print stderr
+            print stderr
+
+        try:
+            os.remove(self.pickle_path)
+        except OSError:
+            pass
+
+        if watchdog.fired or not os.path.exists(self.results_path):
+            reason = watchdog.reason(proc.returncode)
+            print 'Benchmark %s failed: %s' % (bm.name, reason)
+            return _failure(reason)
+
+        result = pickle.load(open(self.results_path, 'rb'))
+        os.remove(self.results_path)
+
+        return result
+
+    def close(self):
+        pass
+
+
+class _PersistentWorker(_Worker):
+    """
+    Runs benchmarks in a long-lived interpreter, fed over a pipe.
+
+    The process is recycled after ``max_tasks`` benchmarks or as soon as
+    its resident memory goes over ``max_rss``, so the isolation between
+    benchmarks is still bounded.
+
+    Parameters
+    ----------
+
+    tmp_dir: working directory of the worker process
+    worker_id: number of the worker inside the runner
+    cpu: CPU the worker process is pinned to, optional
+    python_path: directories put first on the import path of the worker
+                 process, optional
+    rlimit_as: address space limit of the worker process in MB, optional
+    rlimit_cpu: CPU time limit of each benchmark in seconds, optional
+    max_tasks: number of benchmarks before recycling the process, optional
+    max_rss: resident memory in MB before recycling the process, optional
+
+    """
+    def __init__(self, tmp_dir, worker_id=0, cpu=None, python_path=None,
+                 rlimit_as=None, rlimit_cpu=None, max_tasks=None,
+                 max_rss=None):
+        _Worker.__init__(self, tmp_dir, worker_id, cpu, python_path,
+                         rlimit_as, rlimit_cpu)
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.proc = None
+        self.n_tasks = 0
+
+    def _start(self):
+        cmd = self._command('--worker')
+        print ' '.join(cmd)
+        self.proc = _start_process(cmd, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   cwd=self.tmp_dir,
+                                   env=self._environ())
+        self.n_tasks = 0
+
+    def run(self, bm, timeout=None):
+        """Run ``bm``, killing the worker process after ``timeout``
+        seconds, and return its results."""
+        print 'Running benchmark %s ...' % bm.name
+
+        if self.proc is None:
+            self._start()
+
+        watchdog = _Watchdog(self.proc, timeout)
+        try:
+            pickle.dump(bm, self.proc.stdin, pickle.HIGHEST_PROTOCOL)
+            self.proc.stdin.flush()
+            result, rss = pickle.load(self.proc.stdout)
+        except (EOFError, IOError, pickle.UnpicklingError):
+            watchdog.cancel()
+            reason = watchdog.reason(self.proc.wait())
+            print 'Benchmark %s failed: %s' % (bm.name, reason)
+            self.close()
+            return _failure(reason)
+        except BaseException:
+            watchdog.cancel()
+            _kill(self.proc)
+            self.close()
+            raise
+        watchdog.cancel()
+
+        self.n_tasks += 1
+        if (watchdog.fired or
+                (self.max_tasks is not None and
+                 self.n_tasks >= self.max_tasks) or
+                (self.max_rss is not None and rss > self.max_rss)):
+            self.close()
+
+        return result
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            # end of input tells the worker to exit
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        self.proc.wait()
+        self.proc = None
 
 
 class BenchmarkRunner(object):
@@ -14,79 +431,385 @@ class BenchmarkRunner(object):
     ----------
 
     benchmarks: list of Benchmark objects
-    db_path: database path
+    tmp_dir: directory for the scratch files of the workers
+    name: name of the suite, used on plots and reports
+    jobs: number of benchmarks to run in parallel, optional
+    pin_cpus: pin each parallel worker to its own CPU, optional
+    persistent: reuse long-lived worker processes instead of starting a
+                new interpreter per benchmark, optional
+    max_tasks: benchmarks run by a persistent worker before it is
+               recycled, optional
+    max_rss: resident memory in MB above which a persistent worker is
+             recycled, optional
+    db_path: SQLite database where every run is stored, optional.
+             Defaults to the ``db_path`` of each benchmark
+    revision: revision of the code under test the runs are stored with,
+              optional
+    repo_path: git repository of the code under test, whose current
+               commit the fingerprint records, optional
+    max_age: skip the benchmarks having a stored result for the current
+             environment younger than this many seconds, optional
+    python_path: directories put first on the import path of the
+                 benchmark processes, optional
+    loops_cache: JSON file caching the calibrated loop count of each
+                 benchmark checksum, so later runs skip the calibration,
+                 optional
+    timeout: wall-clock limit of each benchmark in seconds, optional.
+             The ``timeout`` of a benchmark takes precedence
+    suite_timeout: wall-clock limit of the whole run in seconds, optional
+    rlimit_as: address space limit of the benchmark processes in MB,
+               optional
+    rlimit_cpu: CPU time limit of each benchmark in seconds, optional
+    overhead: also time an empty statement with the loop count of each
+              benchmark, in the same worker, and report the 'overhead'
+              and the 'corrected_timing', optional
+    overhead_ratio: warn about the benchmarks whose timing is less than
+                    this many times the overhead, optional
+    checkpoint: JSON lines file where the result of each benchmark is
+                appended as soon as it finished, and from which the
+                results are returned, optional. With ``rounds``, the
+                result of each round is appended too
+    resume: skip the benchmarks, or the rounds, which succeeded in the
+            same environment in the ``checkpoint``, optional. The failed
+            ones run again
+    rounds: interleave the benchmarks, splitting their repeats over this
+            many rounds, each one running all the benchmarks in a new
+            random order, optional. The samples of the rounds are merged,
+            so that a drift of the system spreads over all the benchmarks
+    seed: seed of the random orders of the rounds, optional. Drawn at
+          random by default, and kept as the ``seed`` attribute
+    preflight: measure the noise of the machine before running, and
+               'warn' or 'refuse' to run when it is too high, optional
+    max_load: load average per core above which the machine is too
+              noisy, optional
+    max_jitter: relative interquartile range of a calibration loop above
+                which the machine is too noisy, optional
+
+    The fingerprint of the machine, see ``utils.get_fingerprint``, is
+    stored with every result and kept as the ``fingerprint`` attribute.
+
+    Benchmarks going over a limit are recorded as failed, with the
+    'reason', and the rest of the suite keeps running.
 
     """
-    def __init__(self, benchmarks, tmp_dir, name=''):
+    def __init__(self, benchmarks, tmp_dir, name='', jobs=1, pin_cpus=True,
+                 persistent=False, max_tasks=None, max_rss=None,
+                 db_path=None, revision=None, repo_path='.', max_age=None,
+                 python_path=None, loops_cache=None, timeout=None,
+                 suite_timeout=None, rlimit_as=None, rlimit_cpu=None,
+                 overhead=False, overhead_ratio=10, checkpoint=None,
+                 resume=False, rounds=None, seed=None, preflight=None,
+                 max_load=0.5, max_jitter=0.05):
+        if preflight not in (None, 'warn', 'refuse'):
+            raise ValueError('unknown preflight %r' % preflight)
+        if any(getattr(bm, 'params', None) for bm in benchmarks):
+            # every point of a parameter grid is a benchmark of its own
+            benchmarks = [point for bm in benchmarks
+                          for point in bm.expand()]
         self.benchmarks = benchmarks
         self.tmp_dir = tmp_dir
         self.name = name
+        self.jobs = jobs
+        self.pin_cpus = pin_cpus
+        self.persistent = persistent
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.db_path = db_path
+        self.revision = revision
+        self.repo_path = repo_path
+        self.max_age = max_age
+        self.python_path = python_path
+        self.loops_cache = loops_cache
+        self.timeout = timeout
+        self.suite_timeout = suite_timeout
+        self.rlimit_as = rlimit_as
+        self.rlimit_cpu = rlimit_cpu
+        self.overhead = overhead
+        self.overhead_ratio = overhead_ratio
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.rounds = rounds
+        if rounds is not None and seed is None:
+            seed = np.random.randint(2 ** 31)
+        self.seed = seed
+        self.preflight = preflight
+        self.max_load = max_load
+        self.max_jitter = max_jitter
+        self.fingerprint = None
+
+    def _worker(self, worker_id, cpu):
+        if self.persistent:
+            return _PersistentWorker(self.tmp_dir, worker_id, cpu,
+                                     self.python_path, self.rlimit_as,
+                                     self.rlimit_cpu, self.max_tasks,
+                                     self.max_rss)
+        return _Worker(self.tmp_dir, worker_id, cpu, self.python_path,
+                       self.rlimit_as, self.rlimit_cpu)
+
+    def check_noise(self):
+        """Measure the noise of the machine, warning or raising a
+        RuntimeError, as told by ``preflight``, when it is too high.
+
+        Returns
+        -------
+        noise: dict with the 'jitter' and the 'load', see
+               ``utils.measure_noise``
+        """
+        noise = measure_noise()
+        problems = []
+        if noise['load'] is not None and noise['load'] > self.max_load:
+            problems.append('load average of %.2f per core' % noise['load'])
+        if noise['jitter'] > self.max_jitter:
+            problems.append('timing jitter of %.1f%%' %
+                            (100 * noise['jitter']))
+        if problems:
+            message = 'Machine too noisy to benchmark: %s' % ', '.join(
+                problems)
+            if self.preflight == 'refuse':
+                raise RuntimeError(message)
+            warnings.warn(message)
+        return noise
+
+    def _run_rounds(self, queue, run_queue, loops, finish, checkpoint=None):
+        """Run the benchmarks of ``queue`` interleaved over the rounds.
+
+        Each round is streamed to the ``checkpoint``, and the rounds a
+        resumed checkpoint holds are not run again."""
+        pending = []
+        while not queue.empty():
+            pending.append(queue.get())
+
+        rng = np.random.RandomState(self.seed)
+        recorded = checkpoint.read_rounds() if checkpoint is not None else {}
+        by_round = {}
+        for idx, bm in pending:
+            by_round[idx] = dict(
+                (round_, result) for round_, result in
+                recorded.get(_Checkpoint.key(bm), {}).iteritems()
+                if _successful({bm: result}))
+            if bm.ncalls is None and by_round[idx]:
+                # the loop count the recorded rounds used
+                loops.setdefault(bm.checksum, by_round[idx][
+                    min(by_round[idx])]['runtime']['loops'])
+
+        for round_ in xrange(self.rounds):
+            def done(idx, bm, result):
+                by_round[idx][round_] = result
+                # the next rounds use the loop count of the first one
+                if bm.ncalls is None and result['runtime']['success']:
+                    loops.setdefault(bm.checksum, result['runtime']['loops'])
+                if checkpoint is not None:
+                    checkpoint.write(bm, result, round_)
+
+            round_queue = Queue.Queue()
+            for position in rng.permutation(len(pending)):
+                idx, bm = pending[position]
+                # the first rounds take the remainder of the repeats
+                task = copy.copy(bm)
+                task.repeat = bm.repeat // self.rounds + int(
+                    round_ < bm.repeat % self.rounds)
+                if task.repeat and round_ not in by_round[idx]:
+                    round_queue.put((idx, task))
+            run_queue(round_queue, done)
+
+        for idx, bm in pending:
+            result = _merge_rounds([by_round[idx][round_]
+                                    for round_ in sorted(by_round[idx])])
+            if result['runtime']['success']:
+                result['runtime']['seed'] = self.seed
+            finish(idx, bm, result)
+
+    def relative_timings(self, results, ref_bench=None, corrected=False):
+        """Add to each runtime result its 'timeBaselines', the timing
+        relative to the one of ``ref_bench``, by default the fastest
+        benchmark, which is also the fallback when ``ref_bench`` failed.
+        With ``corrected``, the overhead corrected timings are compared
+        instead, where they were measured, unless one of them is zero."""
+        successful = _successful(results)
+        if not successful:
+            return results
+        if ref_bench is not None and ref_bench not in successful:
+            warnings.warn('reference benchmark %s failed, timings are '
+                          'relative to the fastest one' % ref_bench.name)
+            ref_bench = None
+        if corrected:
+            within = [bm.name for bm, result in successful.iteritems()
+                      if result['runtime'].get('corrected_timing') == 0]
+            if within:
+                warnings.warn('timings of %s are within the overhead, '
+                              'comparing the uncorrected timings' %
+                              ', '.join(within))
+                corrected = False
+
+        def timing(runtime):
+            if corrected and 'corrected_timing' in runtime:
+                return runtime['corrected_timing']
+            return runtime['timing']
 
-    def relative_timings(self, results, ref_bench=None):
         if ref_bench is None:
             ref_timing = 1000000
-            for bm, rs in results.iteritems():
+            for bm, rs in successful.iteritems():
                 rs = rs['runtime']
-                if rs['timing'] < ref_timing:
-                    ref_timing = rs['timing']
+                if timing(rs) < ref_timing:
+                    ref_timing = timing(rs)
                     ref_bench = bm
 
-        ref_timing = results[ref_bench]['runtime']['timing']
+        ref_timing = timing(results[ref_bench]['runtime'])
 
-        for bm, rs in results.iteritems():
+        for bm, rs in successful.iteritems():
             rs['runtime'].update(
-                {'timeBaselines': rs['runtime']['timing'] / ref_timing})
+                {'timeBaselines': timing(rs['runtime']) / ref_timing})
 
         return results
 
-    def run(self):
-        results = {}
-        for bm in self.benchmarks:
-            print 'Running benchmark %s ...' % bm.name
-
-            pickle_path = os.path.join(self.tmp_dir, 'benchmark.pickle')
-            results_path = os.path.join(self.tmp_dir, 'results.pickle')
-
-            if os.path.exists(results_path):
-                os.remove(results_path)
-
-            pickle.dump(bm, open(pickle_path, 'wb'))
-
-            dirname = os.path.dirname(__file__)
-
-            cmd = 'python %s/run_benchmarks.py %s %s' % \
-                        (dirname, pickle_path, results_path)
-            print cmd
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                shell=True,
-                                cwd=self.tmp_dir)
-            stdout, stderr = proc.communicate()
-
-            print 'stdout: %s' % stdout
-
-            if stderr:
-                if ("object has no attribute" in stderr or
-                'ImportError' in stderr):
-                    print stderr
-                print stderr
-
-            if not os.path.exists(results_path):
-                return len(self.benchmarks), {}
+    def _check_overhead(self, bm, runtime):
+        """Warn when the timing of ``bm`` is not clearly above the timing
+        overhead."""
+        overhead = runtime.get('overhead')
+        if overhead and runtime['timing'] < self.overhead_ratio * overhead:
+            warnings.warn('%s: timing of %.4g %s is within %gx the timing '
+                          'overhead of %.4g %s' % (
+                              bm.name, runtime['timing'], runtime['units'],
+                              self.overhead_ratio, overhead,
+                              runtime['units']))
 
-            result = pickle.load(open(results_path, 'r'))
+    def run(self):
+        if self.preflight is not None:
+            self.check_noise()
 
-            try:
-                os.remove(pickle_path)
-            except OSError:
-                pass
+        n_jobs = max(1, min(self.jobs, len(self.benchmarks)))
+        cpus = get_cpu_affinity() if self.pin_cpus and n_jobs > 1 else None
+        workers = [self._worker(idx, cpus[idx % len(cpus)] if cpus else None)
+                   for idx in xrange(n_jobs)]
 
+        # array fixtures are written once, here, and mapped by the workers
+        for bm in self.benchmarks:
+            for fixture in bm.all_fixtures():
+                if hasattr(fixture, 'prepare'):
+                    fixture.prepare()
+
+        env = get_environment()
+        self.fingerprint = fingerprint = get_fingerprint(
+            env, repo_path=self.repo_path)
+        dbs = {}
+        for bm in self.benchmarks:
+            db_path = self.db_path or bm.db_path
+            if db_path is not None and db_path not in dbs:
+                dbs[db_path] = BenchmarkDB(db_path)
+
+        loops = {}
+        if self.loops_cache is not None and os.path.exists(self.loops_cache):
+            loops = json.load(open(self.loops_cache))
+
+        deadline = None
+        if self.suite_timeout is not None:
+            deadline = time.time() + self.suite_timeout
+
+        checkpoint = None
+        recorded = {}
+        if self.checkpoint is not None:
+            checkpoint = _Checkpoint(self.checkpoint, env, self.resume)
+            recorded = checkpoint.read()
+
+        queue = Queue.Queue()
+        collected = [None] * len(self.benchmarks)
+        for idx, bm in enumerate(self.benchmarks):
+            # failed benchmarks run again
+            result = recorded.get(_Checkpoint.key(bm))
+            if result is not None and _successful({bm: result}):
+                print 'Skipping benchmark %s, already in the checkpoint' % (
+                    bm.name)
+                continue
+            db = dbs.get(self.db_path or bm.db_path)
+            if db is not None and self.max_age is not None:
+                collected[idx] = db.get_latest_result(bm.checksum, env,
+                                                      self.max_age)
+                if collected[idx] is not None:
+                    print 'Skipping benchmark %s, already measured' % bm.name
+                    continue
+            queue.put((idx, bm))
+
+        def finish(idx, bm, result):
+            result['fingerprint'] = fingerprint
+            collected[idx] = result
+            if result['runtime']['success']:
+                if bm.ncalls is None:
+                    loops[bm.checksum] = result['runtime']['loops']
+                self._check_overhead(bm, result['runtime'])
+            db = dbs.get(self.db_path or bm.db_path)
+            if db is not None:
+                db.write_result(bm, result, env, revision=self.revision,
+                                fingerprint=fingerprint)
+            if checkpoint is not None:
+                checkpoint.write(bm, result)
+
+        def consume(worker, queue, done):
+            while True:
+                try:
+                    idx, bm = queue.get_nowait()
+                except Queue.Empty:
+                    return
+
+                timeout = self.timeout
+                if bm.timeout is not None:
+                    timeout = bm.timeout
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        done(idx, bm, _failure('suite timed out'))
+                        continue
+                    timeout = min(timeout or remaining, remaining)
+
+                task = bm
+                cached = bm.ncalls is None and bm.checksum in loops
+                if cached or (self.overhead and not bm.overhead):
+                    task = copy.copy(bm)
+                    task.overhead = bm.overhead or self.overhead
+                    if cached:
+                        task.ncalls = loops[bm.checksum]
+
+                done(idx, bm, worker.run(task, timeout))
+
+        def run_queue(queue, done):
+            if n_jobs == 1:
+                consume(workers[0], queue, done)
+            else:
+                threads = [threading.Thread(target=consume,
+                                            args=(worker, queue, done))
+                           for worker in workers]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+        try:
+            if self.rounds is None:
+                run_queue(queue, finish)
+            else:
+                self._run_rounds(queue, run_queue, loops, finish,
+                                 checkpoint)
+        finally:
+            for worker in workers:
+                worker.close()
+
+        if self.loops_cache is not None:
+            json.dump(loops, open(self.loops_cache, 'w'), indent=1)
+
+        if checkpoint is not None:
+            # the report comes from the stream, resumed results included
+            recorded = checkpoint.read()
+            collected = [recorded.get(_Checkpoint.key(bm), result)
+                         for bm, result in zip(self.benchmarks, collected)]
+
+        # merge the results back in suite order
+        results = OrderedDict()
+        for bm, result in zip(self.benchmarks, collected):
             results[bm] = result
 
         return len(self.benchmarks), self.relative_timings(results)
 
     def plot_absolute(self, results, fig=None, horizontal=True,
-            colors=list('bgrcmyk'), logy=False):
+            colors=list('bgrcmyk'), logy=False, memory='usage'):
         """Absolute Timing plot.
             Parameters:
             -----------
@@ -95,11 +818,14 @@ class BenchmarkRunner(object):
             horizontal: The plot will be horizontal or vertical, optional
             colors:  the colormap for the plots, optional
             logy:  log scale, optional
+            memory: the memory metric drawn on vertical plots, 'usage'
+                    or 'peak', optional
 
             Returns:
             --------
             fig: matplotlib figure
         """
+        results = _successful(results)
 
         def bar_f(ax, x, y, w, start=None, **kwds):
             if not horizontal:
@@ -118,7 +844,7 @@ class BenchmarkRunner(object):
         pos_prior = np.zeros(len(results))
 
         for idx, (bm, result) in enumerate(results.iteritems()):
-            memories.append(result['memory']['usage'])
+            memories.append(result['memory'][memory])
             result = result['runtime']
             units = result['units']
             y = result['timing']
@@ -158,7 +884,7 @@ class BenchmarkRunner(object):
             ax2 = ax.twinx()
             ax2.plot(x_pos, memories, 'o-')
             ax2.set_xticks([(ax_pos[-1] - ax_pos[0] + 1.25) / 2.0])
-            ax2.set_ylabel('memory in MB')
+            ax2.set_ylabel('%s memory in MB' % memory)
             ax2.set_xticklabels([self.name], rotation=0)
 
         ax.set_title('Absolute timings in %s' % units)
@@ -169,6 +895,152 @@ class BenchmarkRunner(object):
         #plt.savefig('%s.png' % self.name, bbox_inches='tight')
         return fig
 
+    def plot_memory(self, results, fig=None, colors=list('bgrcmyk')):
+        """Memory timeline plot.
+            Parameters:
+            -----------
+            results: The benchmark results from BenchmarkRunner.
+            fig: matplotlib figure object, optional
+            colors:  the colormap for the plots, optional
+
+            Returns:
+            --------
+            fig: matplotlib figure
+        """
+        results = _successful(results)
+
+        if fig is None:
+            fig = plt.figure()
+        ax = fig.add_subplot(111)
+
+        for idx, (bm, result) in enumerate(results.iteritems()):
+            result = result['memory']
+            timeline = result['timeline']
+            x = np.arange(len(timeline)) * result['interval'] * 1e3
+            ax.plot(x, timeline, '-', color=colors[idx % len(colors)],
+                    label='%s (peak %f)' % (bm.name, result['peak']))
+
+        ax.legend(loc='best')
+        ax.set_xlabel('time in ms')
+        ax.set_ylabel('memory in MB')
+        ax.set_title('Memory timelines of %s' % self.name)
+        ax.grid(True)
+
+        return fig
+
+    def plot_latency(self, results, fig=None, colors=list('bgrcmyk')):
+        """Latency distribution plot, for the benchmarks timed call by
+        call.
+            Parameters:
+            -----------
+            results: The benchmark results from BenchmarkRunner.
+            fig: matplotlib figure object, optional
+            colors:  the colormap for the plots, optional
+
+            Returns:
+            --------
+            fig: matplotlib figure
+        """
+        results = _successful(results)
+
+        if fig is None:
+            fig = plt.figure()
+        ax = fig.add_subplot(111)
+
+        for idx, (bm, result) in enumerate(results.iteritems()):
+            result = result.get('latency')
+            if result is None or not result['success']:
+                continue
+            histogram = result['histogram']
+            used = np.flatnonzero(histogram.counts)
+            edges = histogram.edges[used] / 1e3
+            fractions = histogram.counts[used] / float(result['ncalls'])
+            ax.step(edges, fractions, where='post',
+                    color=colors[idx % len(colors)],
+                    label='%s (p99 %.4g, p99.9 %.4g)' % (
+                        bm.name, result['p99'], result['p99.9']))
+
+        ax.set_xscale('log')
+        ax.legend(loc='best')
+        ax.set_xlabel('latency in us')
+        ax.set_ylabel('fraction of the calls')
+        ax.set_title('Latency distributions of %s' % self.name)
+        ax.grid(True)
+
+        return fig
+
+    def scaling(self, results):
+        """Gather the points of the parametrized benchmarks into scaling
+        curves along their ``scale`` parameter.
+
+        Returns
+        -------
+        curves: OrderedDict mapping a (benchmark, other parameters) pair
+                to a dict with the parameter 'values', the 'timing' (in
+                'units') and 'memory' at each value, and the 'complexity'
+                classes ranked by fit_complexity
+        """
+        curves = OrderedDict()
+        for bm, result in _successful(results).iteritems():
+            parent = bm.parent
+            if parent is None or parent.scale is None:
+                continue
+            others = tuple(sorted((key, value) for key, value
+                                  in bm.param_values.iteritems()
+                                  if key != parent.scale))
+            curve = curves.setdefault((parent, others),
+                {'values': [], 'timing': [], 'memory': [],
+                 'units': result['runtime']['units']})
+            curve['values'].append(bm.param_values[parent.scale])
+            curve['timing'].append(result['runtime']['timing'])
+            curve['memory'].append(result['memory']['usage'])
+
+        for curve in curves.values():
+            order = np.argsort(curve['values'])
+            for key in ['values', 'timing', 'memory']:
+                curve[key] = np.asarray(curve[key], dtype=float)[order]
+            if len(order) > 2:
+                curve['complexity'] = fit_complexity(curve['values'],
+                                                     curve['timing'])
+        return curves
+
+    def plot_scaling(self, results, fig=None, colors=list('bgrcmyk')):
+        """Scaling plot, log-log.
+            Parameters:
+            -----------
+            results: The benchmark results from BenchmarkRunner.
+            fig: matplotlib figure object, optional
+            colors:  the colormap for the plots, optional
+
+            Returns:
+            --------
+            fig: matplotlib figure
+        """
+        if fig is None:
+            fig = plt.figure()
+        ax = fig.add_subplot(111)
+
+        scale, units = '', ''
+        for idx, ((bm, others), curve) in enumerate(
+                self.scaling(results).iteritems()):
+            label = bm.name
+            if others:
+                label += ' [%s]' % ', '.join('%s=%s' % other
+                                             for other in others)
+            if 'complexity' in curve:
+                label += ' ~ %s' % curve['complexity'][0][0]
+            ax.loglog(curve['values'], curve['timing'], 'o-',
+                      color=colors[idx % len(colors)], label=label)
+            scale, units = bm.scale, curve['units']
+
+        ax.legend(loc='best')
+        ax.set_xlabel(scale)
+        ax.set_ylabel('time in %s' % units)
+        ax.set_title('Scaling of %s' % self.name)
+        ax.grid(True)
+
+        return fig
+
     def plot_relative(self, results, ref_bench=None, fig=None,
                     horizontal=True, colors=list('bgrcmyk'), logy=False):
         """Relative plot.
@@ -185,6 +1057,7 @@ class BenchmarkRunner(object):
             --------
             fig: matplotlib figure
         """
+        results = _successful(results)
 
         def bar_f(ax, x, y, w, start=None, **kwds):
             if not horizontal:
@@ -259,8 +1132,79 @@ class BenchmarkRunner(object):
 
         return fig
 
+    def plot_parallel(self, results, fig=None, colors=list('bgrcmyk')):
+        """Parallel scaling plot, of the throughput over the number of
+        threads (solid) and processes (dashed).
+            Parameters:
+            -----------
+            results: The benchmark results from BenchmarkRunner.
+            fig: matplotlib figure object, optional
+            colors:  the colormap for the plots, optional
+
+            Returns:
+            --------
+            fig: matplotlib figure
+        """
+        results = _successful(results)
+
+        if fig is None:
+            fig = plt.figure()
+        ax = fig.add_subplot(111)
+
+        for idx, (bm, result) in enumerate(results.iteritems()):
+            result = result.get('parallel')
+            if result is None or not result['success']:
+                continue
+            color = colors[idx % len(colors)]
+            for mode, style in (('threads', 'o-'), ('processes', 's--')):
+                if mode not in result:
+                    continue
+                levels = result[mode]
+                ax.plot([level['workers'] for level in levels],
+                        [level['throughput'] for level in levels], style,
+                        color=color, label='%s (%s)' % (bm.name, mode))
+
+        ax.set_xscale('log', basex=2)
+        ax.set_yscale('log')
+        ax.legend(loc='best')
+        ax.set_xlabel('workers')
+        ax.set_ylabel('calls per second')
+        ax.set_title('Parallel scaling of %s' % self.name)
+        ax.grid(True)
+
+        return fig
+
+    def _describe_machine(self):
+        fingerprint = self.fingerprint or get_fingerprint(
+            repo_path=self.repo_path)
+        lines = ['%s processor, %d cores' % (fingerprint['cpu_model'],
+                                             fingerprint['cpu_cores']),
+                 fingerprint['platform'],
+                 'Python %s (%s)' % (fingerprint['python'],
+                                     fingerprint['python_build'])]
+        lines.extend('%s %s' % (name, version) for name, version
+                     in sorted(fingerprint['packages'].iteritems())
+                     if version is not None)
+        if fingerprint['governor'] is not None:
+            lines.append('CPU frequency governor: %s' %
+                         fingerprint['governor'])
+        if fingerprint['load_average'] is not None:
+            lines.append('Load average: %s' % ', '.join(
+                '%.2f' % load for load in fingerprint['load_average']))
+        if fingerprint['git_revision'] is not None:
+            lines.append('Revision %s' % fingerprint['git_revision'])
+        return '\n'.join('  - %s' % line for line in lines)
+
     def to_rst(self, results, image_relative_path=None,
-        image_absolute_path=None):
+        image_absolute_path=None, stats=False, image_latency_path=None):
+        header = ['name', 'repeat', 'timing', 'loops', 'units']
+        successful = _successful(results)
+        if successful and all('overhead' in result['runtime']
+                              for result in successful.values()):
+            header += ['overhead', 'corrected_timing']
+        if stats:
+            header += STATS_HEADER
+
         output = """
 Performance Benchmarks
 ======================
@@ -270,20 +1214,16 @@ These historical benchmark graphs were produced with `benchy
 
 Produced on a machine with
 
-  - Intel Core i5 950 processor
-  - Mac Os 10.6
-  - Python 2.6.5  64-bit
-  - NumPy 1.6.1
+%s
 
-"""
+""" % self._describe_machine()
         for idx, (bm, result) in enumerate(results.iteritems()):
-            rst_text = bm.to_rst(result)
+            rst_text = bm.to_rst(result, stats)
             output += '\n%s\n%s\n\n' % (bm.name, '-' * len(bm.name)) + rst_text
 
         output += '\n%s\n%s\n%s\n' % ('Final Results',
                     '-' * len('Final Results'),
-                    getAllTable(results,
-             ['name', 'repeat', 'timing', 'loops', 'units', 'timeBaselines']))
+                    getAllTable(results, header + ['timeBaselines']))
 
         if image_relative_path is not None:
             output += ("\n**Performance Relative graph**\n\n.. image:: %s"
@@ -293,6 +1233,10 @@ Produced on a machine with
             output += ("\n**Performance Absolute graph**\n\n.. image:: %s"
                        "\n   :width: 6in" % image_absolute_path)
 
+        if image_latency_path is not None:
+            output += ("\n**Latency distribution graph**\n\n.. image:: %s"
+                       "\n   :width: 6in" % image_latency_path)
+
         return output
 
 
@@ -1,6 +1,16 @@
+import json
+import os
+import sys
+import shutil
+import tempfile
+import warnings
+import subprocess
 from nose.tools import assert_equals
-from ..benchmark import Benchmark, BenchmarkSuite
-from ..runner import BenchmarkRunner
+from nose.plugins.skip import SkipTest
+from ..benchmark import Benchmark, BenchmarkSuite, Fixture, _FixtureCache, \
+    benchmark, gather_benchmarks
+from ..runner import BenchmarkRunner, _failure, _merge_rounds
+from ..db import BenchmarkDB
 
 
 def test_benchmarks():
@@ -47,3 +57,566 @@ def test_benchmark_runner():
 
     runner = BenchmarkRunner(suite, '.')
     #print runner.run()
+
+
+def test_benchmark_runner_parallel():
+    tmp_dir = tempfile.mkdtemp()
+    suite = BenchmarkSuite()
+    for size in [10, 100, 1000]:
+        suite.append(Benchmark("lst = ['c'] * %d" % size, '',
+                               name='list of %d' % size))
+
+    runner = BenchmarkRunner(suite, tmp_dir, jobs=2)
+    n_benchs, results = runner.run()
+
+    assert_equals(n_benchs, 3)
+    assert_equals(results.keys(), suite.benchmarks)
+    for result in results.values():
+        assert_equals(result['runtime']['success'], True)
+    # the per-worker scratch files are cleaned up
+    assert_equals(os.listdir(tmp_dir), [])
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_persistent():
+    tmp_dir = tempfile.mkdtemp()
+    suite = BenchmarkSuite()
+    for size in [10, 100, 1000]:
+        suite.append(Benchmark("lst = ['c'] * %d" % size, '',
+                               name='list of %d' % size))
+
+    runner = BenchmarkRunner(suite, tmp_dir, persistent=True, max_tasks=2)
+    n_benchs, results = runner.run()
+
+    assert_equals(n_benchs, 3)
+    assert_equals(results.keys(), suite.benchmarks)
+    for result in results.values():
+        assert_equals(result['runtime']['success'], True)
+
+    # every benchmark writes the pid of the worker running it
+    suite = BenchmarkSuite()
+    pid_paths = [os.path.join(tmp_dir, 'pid%d' % idx) for idx in range(3)]
+    for path in pid_paths:
+        suite.append(Benchmark('pass', "import os\n"
+                               "open(%r, 'w').write(str(os.getpid()))" % path,
+                               ncalls=1, repeat=1, name=path))
+
+    def pids():
+        return [open(path).read() for path in pid_paths]
+
+    BenchmarkRunner(suite, tmp_dir, persistent=True, max_tasks=2).run()
+    first, second, third = pids()
+    assert_equals(first, second)
+    assert first != third
+
+    # every worker goes over the memory limit
+    BenchmarkRunner(suite, tmp_dir, persistent=True, max_rss=0).run()
+    assert_equals(len(set(pids())), 3)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_incremental():
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, 'results.db')
+    bench = Benchmark("lst = ['c'] * 100", '', name='list with "*"')
+    bench2 = Benchmark("lst = ['c' for x in xrange(100)]", '',
+                       name='list with xrange')
+
+    runner = BenchmarkRunner([bench], tmp_dir, db_path=db_path)
+    n_benchs, results = runner.run()
+    db = BenchmarkDB(db_path)
+    assert_equals(len(db.get_results(bench.checksum)), 1)
+
+    runner = BenchmarkRunner([bench, bench2], tmp_dir, db_path=db_path,
+                             max_age=3600)
+    n_benchs, results = runner.run()
+    # the fresh result of bench is reused, only bench2 is run again
+    assert_equals(len(db.get_results(bench.checksum)), 1)
+    assert_equals(len(db.get_results(bench2.checksum)), 1)
+    assert_equals(results[bench]['runtime']['success'], True)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_checkpoint():
+    tmp_dir = tempfile.mkdtemp()
+    checkpoint = os.path.join(tmp_dir, 'checkpoint.jsonl')
+    bench = Benchmark("lst = ['c'] * 100", '', name='list', allocations=True)
+    # the same code run differently
+    fixed = Benchmark("lst = ['c'] * 100", '', name='list, 50 loops',
+                      ncalls=50, repeat=5)
+    runner = BenchmarkRunner([bench, fixed], tmp_dir, name='checkpoint',
+                             checkpoint=checkpoint)
+    n_benchs, results = runner.run()
+    samples = results[bench]['runtime']['samples']
+    assert results[bench]['runtime']['loops'] != 50
+    assert_equals(results[fixed]['runtime']['loops'], 50)
+
+    bench2 = Benchmark("lst = ['c' for x in xrange(100)]", '',
+                       name='list comprehension')
+    record = json.loads(open(checkpoint).readline())
+    failure = {'success': False, 'reason': 'killed',
+               'runtime': {'success': False}, 'memory': {'success': False}}
+    with open(checkpoint, 'a') as f:
+        # a result from another machine is ignored, a failure runs again
+        f.write(json.dumps(dict(record, environment_checksum='other',
+                                result=failure)) + '\n')
+        f.write(json.dumps(dict(record, checksum=bench2.checksum,
+                                name=bench2.name, result=failure)) + '\n')
+        # the last line of a killed run is cut short
+        f.write('{"checksum": "')
+
+    runner = BenchmarkRunner([bench, fixed, bench2], tmp_dir,
+                             name='checkpoint', checkpoint=checkpoint,
+                             resume=True)
+    n_benchs, results = runner.run()
+    assert_equals(n_benchs, 3)
+    assert_equals(list(results[bench]['runtime']['samples']), list(samples))
+    assert_equals(results[fixed]['runtime']['repeat'], 5)
+    assert_equals(results[bench2]['runtime']['success'], True)
+    assert_equals(len(open(checkpoint).readlines()), 5)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_rounds():
+    tmp_dir = tempfile.mkdtemp()
+    bench = Benchmark("lst = ['c'] * 100", '', name='list', repeat=3)
+    bench2 = Benchmark("lst = ['c' for x in xrange(100)]", '',
+                       name='list comprehension', repeat=4)
+    runner = BenchmarkRunner([bench, bench2], tmp_dir, name='rounds',
+                             rounds=2, seed=42, overhead=True)
+    n_benchs, results = runner.run()
+    for bm, result in results.iteritems():
+        runtime = result['runtime']
+        assert_equals(runtime['rounds'], 2)
+        # the repeats are split exactly over the rounds
+        assert_equals(runtime['repeat'], bm.repeat)
+        assert_equals(len(runtime['samples']), bm.repeat)
+        assert_equals(runtime['seed'], 42)
+        assert_equals(runtime['corrected_timing'],
+                      max(runtime['timing'] - runtime['overhead'], 0.0))
+    assert_equals(results[bench]['runtime']['timeBaselines'], 1.0)
+    assert BenchmarkRunner([bench], tmp_dir, rounds=2).seed is not None
+
+    # a run killed after its first round resumes with the second one
+    checkpoint = os.path.join(tmp_dir, 'checkpoint.jsonl')
+    runner = BenchmarkRunner([bench], tmp_dir, rounds=2, seed=42,
+                             checkpoint=checkpoint)
+    runner.run()
+    records = [json.loads(line) for line in open(checkpoint)]
+    assert_equals([record['round'] for record in records], [0, 1, None])
+    with open(checkpoint, 'w') as f:
+        f.write(json.dumps(records[0]) + '\n')
+    runner = BenchmarkRunner([bench], tmp_dir, rounds=2, seed=42,
+                             checkpoint=checkpoint, resume=True)
+    n_benchs, results = runner.run()
+    samples = results[bench]['runtime']['samples']
+    assert_equals(len(samples), 3)
+    assert_equals(samples[:2].tolist(),
+                  records[0]['result']['runtime']['samples']['__ndarray__'])
+    assert_equals(len(open(checkpoint).readlines()), 3)
+
+    runner = BenchmarkRunner([bench], tmp_dir, rounds=2, suite_timeout=0)
+    n_benchs, results = runner.run()
+    assert_equals(results[bench]['reason'], 'suite timed out')
+    shutil.rmtree(tmp_dir)
+
+
+def test_merge_rounds():
+    def round_result(samples, overhead, gc_collections):
+        return {'success': True,
+                'runtime': {'success': True, 'samples': samples,
+                            'timing': min(samples), 'overhead': overhead,
+                            'corrected_timing': min(samples) - overhead,
+                            'gc_collections': gc_collections,
+                            'gc_time': 0.5},
+                'memory': {'success': True, 'usage': 1.0}}
+
+    first = round_result([3.0, 4.0], 0.5, [2, 1, 0])
+    second = round_result([2.0], 1.0, [1, 0, 1])
+    runtime = _merge_rounds([first, second])['runtime']
+    assert_equals(runtime['timing'], 2.0)
+    assert_equals(runtime['overhead'], 0.5)
+    assert_equals(runtime['corrected_timing'], 1.5)
+    assert_equals(runtime['gc_collections'], [3, 1, 1])
+    assert_equals(runtime['gc_time'], 1.0)
+    # a round cut by the suite deadline fails the whole benchmark
+    merged = _merge_rounds([first, _failure('suite timed out')])
+    assert_equals(merged['reason'], 'suite timed out')
+
+
+def test_benchmark_runner_preflight():
+    tmp_dir = tempfile.mkdtemp()
+    bench = Benchmark("lst = ['c'] * 100", '', name='list')
+    runner = BenchmarkRunner([bench], tmp_dir, name='preflight',
+                             preflight='warn', max_load=1e6, max_jitter=1e6)
+    n_benchs, results = runner.run()
+    fingerprint = results[bench]['fingerprint']
+    assert fingerprint['cpu_cores'] >= 1
+    assert 'numpy' in fingerprint['packages']
+    assert fingerprint['cpu_model'] in runner.to_rst(results)
+
+    runner = BenchmarkRunner([bench], tmp_dir, preflight='refuse',
+                             max_jitter=-1)
+    try:
+        runner.run()
+    except RuntimeError as e:
+        assert 'too noisy' in str(e)
+    else:
+        raise AssertionError('the noisy machine was not refused')
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_loops_cache():
+    tmp_dir = tempfile.mkdtemp()
+    loops_cache = os.path.join(tmp_dir, 'loops.json')
+    bench = Benchmark("lst = ['c'] * 100", '', name='list with "*"')
+
+    runner = BenchmarkRunner([bench], tmp_dir, loops_cache=loops_cache)
+    n_benchs, results = runner.run()
+    loops = results[bench]['runtime']['loops']
+    assert_equals(json.load(open(loops_cache)), {bench.checksum: loops})
+
+    n_benchs, results = runner.run()
+    assert_equals(results[bench]['runtime']['loops'], loops)
+    assert_equals(results[bench]['runtime']['calibration_runs'], 0)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_overhead():
+    tmp_dir = tempfile.mkdtemp()
+    bench = Benchmark('x = 1', '', name='assignment')
+    runner = BenchmarkRunner([bench], tmp_dir, name='overhead',
+                             overhead=True, overhead_ratio=1e6)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        n_benchs, results = runner.run()
+    runtime = results[bench]['runtime']
+    assert runtime['overhead'] > 0
+    assert runtime['corrected_timing'] <= runtime['timing']
+    assert_equals(len(caught), 1)
+    assert 'assignment' in str(caught[0].message)
+
+    runner.relative_timings(results, corrected=True)
+    assert_equals(runtime['timeBaselines'], 1.0)
+    assert 'corrected_timing' in runner.to_rst(results)
+
+    # a timing within the overhead is clamped to zero
+    runtime['corrected_timing'] = 0.0
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        runner.relative_timings(results, corrected=True)
+    assert 'within the overhead' in str(caught[0].message)
+    assert_equals(runtime['timeBaselines'], 1.0)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_latency():
+    tmp_dir = tempfile.mkdtemp()
+    bench = Benchmark("lst = ['c'] * 1000", '', name='list', latency=True,
+                      latency_calls=2000)
+    runner = BenchmarkRunner([bench], tmp_dir, name='latency')
+    n_benchs, results = runner.run()
+    latency = results[bench]['latency']
+    assert_equals(latency['success'], True)
+    assert_equals(latency['ncalls'], 2000)
+    assert latency['p50'] <= latency['p99.9'] <= latency['max']
+    assert 'Latency per call' in runner.to_rst(results)
+    runner.plot_latency(results)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_coroutine():
+    try:
+        import asyncio
+    except ImportError:
+        try:
+            import trollius
+        except ImportError:
+            raise SkipTest('neither asyncio nor trollius is available')
+
+    setup = ('try:\n    import asyncio\n'
+             'except ImportError:\n    import trollius as asyncio')
+    bench = Benchmark('asyncio.sleep(0.001)', setup, ncalls=50,
+                      name='sleep', coroutine=True, concurrency=(1, 10))
+    results = bench.run()
+    runtime = results['runtime']
+    assert_equals(runtime['success'], True)
+    assert_equals(results['memory']['success'], True)
+    assert runtime['timing'] >= 1.0
+    levels = runtime['levels']
+    assert_equals([level['concurrency'] for level in levels], [1, 10])
+    # the sleeps overlap with 10 of them at once
+    assert levels[1]['throughput'] > 2 * levels[0]['throughput']
+    assert levels[0]['p50'] >= 1000
+    assert 'Concurrency levels' in bench.to_rst(results)
+
+
+def test_benchmark_parallel():
+    tmp_dir = tempfile.mkdtemp()
+    bench = Benchmark('total = sum(xrange(1000))', '', ncalls=200,
+                      name='sum', workers=2)
+    runner = BenchmarkRunner([bench], tmp_dir, name='parallel')
+    n_benchs, results = runner.run()
+    parallel = results[bench]['parallel']
+    assert_equals(parallel['success'], True)
+    for mode in ('threads', 'processes'):
+        levels = parallel[mode]
+        assert_equals([level['workers'] for level in levels], [1, 2])
+        assert_equals(levels[0]['efficiency'], 1.0)
+        assert all(level['throughput'] > 0 for level in levels)
+    assert 'Parallel scaling' in runner.to_rst(results)
+    runner.plot_parallel(results)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_limits():
+    tmp_dir = tempfile.mkdtemp()
+    hang = Benchmark('time.sleep(60)', 'import time', ncalls=1, repeat=1,
+                     name='hang')
+    spin = Benchmark('while True: pass', '', ncalls=1, repeat=1,
+                     name='spin')
+    bench = Benchmark("lst = ['c'] * 100", '', name='list with "*"')
+
+    for persistent in [False, True]:
+        runner = BenchmarkRunner([hang, spin, bench], tmp_dir, timeout=4,
+                                 rlimit_cpu=1, persistent=persistent)
+        n_benchs, results = runner.run()
+
+        assert_equals(results[hang]['success'], False)
+        assert_equals(results[hang]['reason'], 'timed out after 4 s')
+        assert_equals(results[spin]['success'], False)
+        assert_equals(results[spin]['reason'], 'CPU time limit exceeded')
+        # the rest of the suite keeps running
+        assert_equals(results[bench]['success'], True)
+        assert_equals(results[bench]['runtime']['timeBaselines'], 1.0)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            runner.relative_timings(results, ref_bench=hang)
+        assert 'hang' in str(caught[0].message)
+        assert_equals(results[bench]['runtime']['timeBaselines'], 1.0)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_runner_timeout_fork():
+    tmp_dir = tempfile.mkdtemp()
+    # the forked measurement dies along with the benchmark process
+    spin = Benchmark('while True: pass', '', ncalls=1, repeat=1,
+                     name='spin', fork=True)
+    bench = Benchmark("lst = ['c'] * 100", '', name='list with "*"')
+    for persistent in [False, True]:
+        runner = BenchmarkRunner([spin, bench], tmp_dir, timeout=2,
+                                 persistent=persistent)
+        n_benchs, results = runner.run()
+        assert_equals(results[spin]['reason'], 'timed out after 2 s')
+        assert_equals(results[bench]['success'], True)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_allocations():
+    try:
+        import tracemalloc
+    except ImportError:
+        raise SkipTest('tracemalloc is not available')
+
+    bench = Benchmark("lst = [str(x) for x in xrange(1000)]", '',
+                      allocation_calls=5, name='list of strings')
+    results = bench.run(allocations=True, top=3)
+    allocations = results['allocations']
+    assert_equals(allocations['success'], True)
+    assert allocations['peak'] > 0
+    assert len(allocations['top']) <= 3
+    # the strings of the previous call are freed, those of the call count
+    assert_equals(allocations['ncalls'], 5)
+    assert allocations['retained_blocks'] >= 1000
+    assert allocations['retained_bytes'] <= allocations['peak']
+    assert 'Memory retained per call' in bench.to_rst(results)
+
+
+def test_benchmark_fork():
+    # the statement fails if it does not run in a child process, or if the
+    # state left by a previous measurement leaks into the next one
+    setup = 'import os; parent = os.getpid(); data = []'
+    statement = 'assert os.getpid() != parent and len(data) < 10\n' \
+                'data.append(1)'
+    bench = Benchmark(statement, setup, ncalls=10, name='fork', fork=True)
+
+    results = bench.run()
+    assert_equals(results['success'], True)
+    assert_equals(results['runtime']['repeat'], 3)
+    assert_equals(len(results['runtime']['samples']), 3)
+    assert_equals(results['memory']['repeat'], 3)
+
+    assert_equals(bench.run(fork=False)['success'], False)
+
+    # an unreachable precision stops at max_repeat, forked or not
+    bench = Benchmark('time.sleep(random.random() / 1e3)',
+                      'import random, time', ncalls=1, name='adaptive',
+                      target_precision=1e-9, max_repeat=8)
+    for fork in [True, False]:
+        assert_equals(bench.run(fork=fork)['runtime']['repeat'], 8)
+
+
+def test_benchmark_gc():
+    bench = Benchmark('lst = [[] for _ in xrange(1000)]', '', ncalls=10,
+                      name='gc', gc='enabled')
+    for fork in [True, False]:
+        runtime = bench.run(fork=fork)['runtime']
+        assert sum(runtime['gc_collections']) > 0
+        assert runtime['gc_time'] >= 0
+    assert 'gc_collections' in bench.to_rst(bench.run())
+
+
+def test_benchmark_fixtures():
+    tmp_dir = tempfile.mkdtemp()
+    suite = BenchmarkSuite()
+    suite.fixture('data', 'import time; time.sleep(0.2); data = range(1000)')
+    suite.append(Benchmark('sum(data)', '', name='sum'))
+    suite.append(Benchmark('max(data)', '', name='max'))
+    checksums = [bm.checksum for bm in suite]
+    # the fixtures of the suite are part of the checksums
+    assert Benchmark('sum(data)', '', name='sum').checksum != checksums[0]
+    other = BenchmarkSuite([Benchmark('sum(data)', '', name='sum')])
+    other.fixture('data', 'data = range(10)')
+    assert other[0].checksum not in checksums
+
+    # handed over as a plain list, as the discovery does
+    runner = BenchmarkRunner(list(suite), tmp_dir, persistent=True)
+    assert_equals([bm.checksum for bm in suite], checksums)
+    n_benchs, results = runner.run()
+
+    first, second = [results[bm]['fixtures'] for bm in suite]
+    # built once per worker, outside of the measurements
+    assert first['build_time']['data'] >= 0.2
+    assert_equals(first['cached'], [])
+    assert_equals(second['build_time']['data'], 0.0)
+    assert_equals(second['cached'], ['data'])
+    assert results[suite[0]]['runtime']['timing'] < 100
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_module_fixtures():
+    fixture = Fixture('torn', 'torn = []', 'torn.append(1)', scope='module')
+    bench = Benchmark('torn', '', fixtures=[fixture], module='first')
+    bench2 = Benchmark('torn', '', fixtures=[fixture], module='second')
+
+    cache = _FixtureCache()
+    value, build_time = cache.get(fixture, bench.module)
+    assert build_time is not None
+    assert_equals(cache.get(fixture, bench.module), (value, None))
+    # moving on to another module tears the previous fixture down
+    value2, build_time = cache.get(fixture, bench2.module)
+    assert build_time is not None
+    assert_equals(value, [1])
+    cache.teardown()
+    assert_equals(value2, [1])
+
+
+def test_benchmark_array_fixtures():
+    tmp_dir = tempfile.mkdtemp()
+    suite = BenchmarkSuite()
+    arr = suite.array_fixture('arr', 'import numpy as np\n'
+                                     'arr = np.arange(10 ** 6)')
+    # every process maps the same read-only file
+    setup = 'assert not arr.flags.writeable'
+    suite.append(Benchmark('arr.sum()', setup, name='sum'))
+    suite.append(Benchmark('arr.max()', setup, name='max'))
+
+    runner = BenchmarkRunner(suite, tmp_dir, jobs=2)
+    n_benchs, results = runner.run()
+
+    assert os.path.exists(arr.path)
+    for result in results.values():
+        assert_equals(result['success'], True)
+        assert_equals(result['fixtures']['creation_time']['arr'],
+                      arr.creation_time)
+
+    path = arr.path
+    arr.remove()
+    assert not os.path.exists(path)
+    shutil.rmtree(tmp_dir)
+
+
+def test_benchmark_params():
+    tmp_dir = tempfile.mkdtemp()
+    bench = Benchmark('lst = sorted(data)',
+                      'import random; data = [random.random() '
+                      'for _ in xrange(n)]',
+                      name='sort', params={'n': [10, 1000, 100000]})
+    points = bench.expand()
+    assert_equals([point.name for point in points],
+                  ['sort[n=10]', 'sort[n=1000]', 'sort[n=100000]'])
+    assert_equals(len(set(point.checksum for point in points)), 3)
+
+    runner = BenchmarkRunner([bench], tmp_dir, name='sort')
+    n_benchs, results = runner.run()
+    assert_equals(n_benchs, 3)
+
+    curves = runner.scaling(results)
+    curve = curves[(bench, ())]
+    assert_equals(list(curve['values']), [10, 1000, 100000])
+    assert curve['timing'][0] < curve['timing'][-1]
+    assert_equals(len(curve['complexity']), 4)
+    runner.plot_scaling(results)
+
+    bench = Benchmark('lst = range(n)', '', ncalls=10, name='range',
+                      params={'n': [1, 10, 100]})
+    rst_text = bench.to_rst(bench.run())
+    assert 'range[n=100]' in rst_text
+    assert 'Complexity along n' in rst_text
+    shutil.rmtree(tmp_dir)
+
+
+def make_list(n=1000):
+    return (range(n),)
+
+
+@benchmark(setup=make_list, name='sorted list', params={'n': [10, 1000]})
+def sort_list(lst):
+    return sorted(lst)
+
+
+SCRIPT = """
+import sys
+from %s import benchmark
+from %s import BenchmarkRunner
+
+
+@benchmark(name='build')
+def build():
+    return range(100)
+
+
+if __name__ == '__main__':
+    n_benchs, results = BenchmarkRunner([build.benchmark], sys.argv[1]).run()
+    sys.exit(0 if results[build.benchmark]['success'] else 1)
+""" % (Benchmark.__module__, BenchmarkRunner.__module__)
+
+
+def test_benchmark_callable():
+    tmp_dir = tempfile.mkdtemp()
+    bench = sort_list.benchmark
+    assert_equals(gather_benchmarks({'sort_list': sort_list}), [bench])
+    assert 'return sorted(lst)' in bench.code
+    assert 'def make_list' in bench.setup
+
+    point = bench.expand()[0]
+    results = point.run()
+    assert_equals(results['success'], True)
+    assert_equals(results['memory']['success'], True)
+    point.profile(3)
+
+    # the functions pickle by name, so the runner can use them
+    runner = BenchmarkRunner([bench], tmp_dir, name='sorted list')
+    n_benchs, results = runner.run()
+    assert_equals(n_benchs, 2)
+    assert_equals(len(results), 2)
+
+    # even when defined in the script driving the runner
+    script = os.path.join(tmp_dir, 'script.py')
+    with open(script, 'w') as f:
+        f.write(SCRIPT)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    assert_equals(subprocess.call([sys.executable, script, tmp_dir],
+                                  env=env), 0)
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from nose.tools import assert_equals
+from ..benchmark import Benchmark
+from ..compare import compare, regressions, save_results, load_results, \
+    to_rst
+from ..cli import main
+
+
+def _result(samples, usage=1.0):
+    samples = np.asarray(samples)
+    return {'success': True,
+            'runtime': {'success': True, 'samples': samples,
+                        'timing': samples.min(), 'units': 'ms'},
+            'memory': {'success': True, 'usage': usage, 'units': 'MB'}}
+
+
+def test_compare():
+    rng = np.random.RandomState(0)
+    same = Benchmark('x = 1', '', name='same')
+    slower = Benchmark('x = 2', '', name='slower')
+    faster = Benchmark('x = 3', '', name='faster')
+    bigger = Benchmark('x = 4', '', name='bigger')
+    noisy = Benchmark('x = 5', '', name='noisy', threshold=0.5)
+    # matched by name, the code changed
+    renamed = Benchmark('x = 6', '', name='slower')
+
+    baseline = OrderedDict([
+        (same, _result(1 + rng.rand(20) * 0.01)),
+        (slower, _result(1 + rng.rand(20) * 0.01)),
+        (faster, _result(1 + rng.rand(20) * 0.01)),
+        (bigger, _result(1 + rng.rand(20) * 0.01)),
+        (noisy, _result(1 + rng.rand(20) * 0.01))])
+    candidate = OrderedDict([
+        (same, _result(1 + rng.rand(20) * 0.01)),
+        (renamed, _result(2 + rng.rand(20) * 0.01)),
+        (faster, _result(0.5 + rng.rand(20) * 0.01)),
+        (bigger, _result(1 + rng.rand(20) * 0.01, usage=10.0)),
+        (noisy, _result(1.2 + rng.rand(20) * 0.01))])
+
+    comparisons = compare(baseline, candidate)
+    names = [c['name'] for c in comparisons]
+    assert_equals(names[:2], ['slower', 'noisy'])
+    assert_equals(names[-1], 'faster')
+    status = dict((c['name'], c['status']) for c in comparisons)
+    assert_equals(status, {'slower': 'regression', 'noisy': 'unchanged',
+                           'same': 'unchanged', 'bigger': 'unchanged',
+                           'faster': 'improvement'})
+    assert_equals([c['name'] for c in regressions(comparisons)],
+                  ['slower', 'bigger'])
+    assert 'regression' in to_rst(comparisons)
+
+    # the test cannot reach alpha with the default 3 repeats
+    few_baseline = OrderedDict([
+        (same, _result([1.0, 1.01, 1.02])),
+        (slower, _result([1.0, 1.01, 1.02])),
+        (faster, {'success': False, 'runtime': {'success': False},
+                  'memory': {'success': False}}),
+        (bigger, _result([1.0, 1.01, 1.02]))])
+    few_candidate = OrderedDict([
+        (same, _result([1.01, 1.0, 1.02])),
+        (slower, _result([2.0, 2.01, 2.02])),
+        (faster, _result([1.0, 1.01, 1.02])),
+        (bigger, _result([1.0, 1.01, 1.02]))])
+    # results kept without their samples
+    del few_baseline[bigger]['runtime']['samples']
+    status = dict((c['name'], c['status'])
+                  for c in compare(few_baseline, few_candidate))
+    assert_equals(status, {'same': 'insufficient samples',
+                           'slower': 'regression',
+                           'faster': 'baseline failed',
+                           'bigger': 'insufficient samples'})
+
+    tmp_dir = tempfile.mkdtemp()
+    baseline_path = os.path.join(tmp_dir, 'baseline.pickle')
+    candidate_path = os.path.join(tmp_dir, 'candidate.pickle')
+    save_results(baseline, baseline_path)
+    save_results(candidate, candidate_path)
+    assert_equals(len(load_results(baseline_path)), 5)
+    assert_equals(main(['--compare', baseline_path, candidate_path]), 1)
+    assert_equals(main(['--compare', baseline_path, baseline_path]), 0)
+    shutil.rmtree(tmp_dir)
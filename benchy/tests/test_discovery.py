@@ -0,0 +1,102 @@
+import os
+import sys
+import shutil
+import tempfile
+from nose.tools import assert_equals
+from ..benchmark import Benchmark
+from ..discovery import BenchmarkIndex
+from ..cli import main
+from ..compare import load_results
+
+
+# benchy may be imported under another name by the test runner
+LISTS = """
+from %s import Benchmark, benchmark
+
+range_list = Benchmark('lst = range(1000)', '', name='range list',
+                       tags=['lists'])
+comprehension = Benchmark('lst = [x for x in xrange(1000)]', '',
+                          name='comprehension list', tags=['lists', 'slow'])
+
+
+@benchmark(name='sorted list', tags=['lists'])
+def sorted_list():
+    return sorted(range(1000, 0, -1))
+""" % Benchmark.__module__
+
+# same file name as LISTS, in another directory
+OTHER_LISTS = """
+from %s import benchmark
+
+
+@benchmark(name='reversed list', tags=['lists'])
+def reversed_list():
+    return list(reversed(range(1000)))
+""" % Benchmark.__module__
+
+FIXTURES = """
+from %s import Benchmark, BenchmarkSuite
+
+suite = BenchmarkSuite()
+suite.append(Benchmark('sum(data)', '', name='sum of data'))
+suite.fixture('data', 'data = range(1000)')
+""" % Benchmark.__module__
+
+BROKEN = """
+import no_such_module
+"""
+
+
+def _write(path, source):
+    with open(path, 'w') as f:
+        f.write(source)
+
+
+def test_benchmark_index():
+    tmp_dir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(tmp_dir, 'more'))
+    os.mkdir(os.path.join(tmp_dir, 'other'))
+    _write(os.path.join(tmp_dir, 'bench_lists.py'), LISTS)
+    _write(os.path.join(tmp_dir, 'other', 'bench_lists.py'), OTHER_LISTS)
+    _write(os.path.join(tmp_dir, 'more', 'bench_broken.py'), BROKEN)
+    _write(os.path.join(tmp_dir, 'more', 'bench_fixtures.py'), FIXTURES)
+    _write(os.path.join(tmp_dir, 'helpers.py'), BROKEN)
+
+    path = list(sys.path)
+    index = BenchmarkIndex(tmp_dir)
+    assert_equals(len(index.update()), 4)
+    assert_equals(sys.path, path)
+    assert_equals(index.errors().keys(),
+                  [os.path.join(tmp_dir, 'more', 'bench_broken.py')])
+    assert_equals(len(index.select()), 5)
+    assert_equals([entry['name'] for _, entry in index.select(tags=['slow'])],
+                  ['comprehension list'])
+    assert_equals(len(index.select(regex='^(range|sorted)')), 2)
+    assert_equals(len(index.select(names=['range list'])), 1)
+    assert_equals(sys.modules['other.bench_lists'].reversed_list.__name__,
+                  'reversed_list')
+    assert hasattr(sys.modules['bench_lists'], 'sorted_list')
+
+    # a new index reads the files it already knows from disk
+    index = BenchmarkIndex(tmp_dir)
+    assert_equals(index.update(), [])
+    os.utime(os.path.join(tmp_dir, 'bench_lists.py'), (0, 0))
+    assert_equals(index.update(), [os.path.join(tmp_dir, 'bench_lists.py')])
+
+    selected = index.select(regex='sorted')
+    benchmarks = index.load(selected)
+    assert_equals([bm.name for bm in benchmarks], ['sorted list'])
+    assert_equals(index.python_path(selected), [tmp_dir])
+
+    assert_equals(main(['--list', tmp_dir]), 0)
+    assert_equals(main(['--tag', 'lists', '-k', 'sorted', tmp_dir]), 0)
+    # the benchmark processes load the module from its file
+    saved = os.path.join(tmp_dir, 'results.pickle')
+    assert_equals(main(['-k', 'reversed', '--save', saved, tmp_dir]), 0)
+    results = load_results(saved)
+    assert_equals([key.name for key in results], ['reversed list'])
+    assert results.values()[0]['runtime']['success']
+    # the benchmarks of a suite get its fixtures
+    assert_equals(main(['-k', 'sum of data', '--save', saved, tmp_dir]), 0)
+    assert load_results(saved).values()[0]['runtime']['success']
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import subprocess
+from nose.tools import assert_equals
+from ..benchmark import Benchmark, BenchmarkSuite
+from ..revisions import RevisionRunner
+
+
+def _commit(repo, source, message):
+    with open(os.path.join(repo, 'slowmod.py'), 'w') as f:
+        f.write(source)
+    subprocess.check_call(['git', 'add', 'slowmod.py'], cwd=repo)
+    subprocess.check_call(['git', '-c', 'user.name=benchy',
+                           '-c', 'user.email=benchy@example.com',
+                           'commit', '-q', '-m', message], cwd=repo)
+
+
+def test_revision_runner():
+    tmp_dir = tempfile.mkdtemp()
+    repo = os.path.join(tmp_dir, 'repo')
+    os.mkdir(repo)
+    subprocess.check_call(['git', 'init', '-q'], cwd=repo)
+    _commit(repo, 'def f():\n    return range(10)\n', 'first')
+    _commit(repo, 'def f():\n    return range(1000)\n', 'second')
+
+    db_path = os.path.join(tmp_dir, 'results.db')
+    suite = BenchmarkSuite()
+    suite.fixture('n', 'n = 2')
+    bench = Benchmark('f()[:n]', 'from slowmod import f', name='f',
+                      db_path=db_path)
+    suite.append(bench)
+    runner = RevisionRunner(suite, repo, tmp_dir, db_path)
+    revisions = runner.revisions('HEAD~1')
+    assert_equals(len(revisions), 1)
+    revisions = ['HEAD~1'] + revisions
+
+    results = runner.run(revisions)
+    assert_equals(len(results), 2)
+    history = runner.history(bench, revisions)
+    timings = [result['runtime']['timing'] for result in history.values()]
+    assert timings[0] < timings[1]
+    # the fingerprint records the commit measured, not the current one
+    for revision, result in history.iteritems():
+        assert_equals(result['fingerprint']['git_revision'], revision)
+
+    # every (commit, benchmark) pair is measured and stored only once
+    assert_equals(len(runner.db.get_results(bench.checksum)), 2)
+    assert_equals(len(runner.run(revisions)), 0)
+
+    # and so is every point of a parameter grid
+    grid = Benchmark('f()[:n]', 'from slowmod import f', name='grid',
+                     params={'n': [1, 2]}, db_path=db_path)
+    runner = RevisionRunner([grid], repo, tmp_dir, db_path)
+    assert_equals(len(runner.run(['HEAD'])), 1)
+    assert_equals(len(runner.run(['HEAD'])), 0)
+    for point in grid.expand():
+        assert_equals(len(runner.db.get_results(point.checksum)), 1)
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,160 @@
+import gc
+import numpy as np
+from nose.tools import assert_equals, assert_almost_equals, assert_raises
+from ..utils import sample_stats, magic_timeit, magic_memit, \
+    magic_latency, fit_complexity, mann_whitney_u, min_p_value, \
+    LatencyHistogram, GCMonitor, gc_call
+
+
+def test_sample_stats():
+    stats = sample_stats([1.0, 2.0, 3.0, 4.0, 5.0])
+    assert_equals(stats['median'], 3.0)
+    assert_equals(stats['mean'], 3.0)
+    assert_equals(stats['min'], 1.0)
+    assert_equals(stats['max'], 5.0)
+    assert_equals(stats['iqr'], 2.0)
+    assert_almost_equals(stats['std'], np.sqrt(2.0))
+    assert stats['ci_low'] <= stats['median'] <= stats['ci_high']
+
+
+def test_magic_timeit_samples():
+    result = magic_timeit({}, "lst = ['c'] * 100", ncalls=10, repeat=5,
+                          force_ms=True)
+    assert_equals(result['samples'].shape, (5,))
+    assert_equals(result['timing'], result['samples'].min())
+    assert result['min'] <= result['median'] <= result['max']
+
+
+def test_magic_timeit_adaptive():
+    result = magic_timeit({}, "lst = ['c'] * 100", ncalls=100, repeat=3,
+                          target_precision=1e-9, max_repeat=20)
+    # an unreachable precision stops at max_repeat
+    assert_equals(result['repeat'], 20)
+    assert_equals(len(result['samples']), 20)
+
+    result = magic_timeit({}, "lst = ['c'] * 100", ncalls=100, repeat=3,
+                          target_precision=10.0)
+    assert_equals(result['repeat'], 3)
+    assert result['precision'] <= 10.0
+
+
+def test_magic_timeit_calibration():
+    result = magic_timeit({}, "lst = ['c'] * 100", repeat=3,
+                          target_time=0.01)
+    assert result['calibration_runs'] >= 1
+    assert_equals(result['repeat'], 3)
+
+    # a statement slower than the target time runs once per sample and
+    # reuses its calibration run
+    result = magic_timeit({'time': __import__('time')}, "time.sleep(0.01)",
+                          repeat=2, target_time=0.001)
+    assert_equals(result['loops'], 1)
+    assert_equals(result['calibration_runs'], 1)
+
+
+def test_magic_timeit_overhead():
+    result = magic_timeit({}, 'pass', repeat=3, target_time=0.01,
+                          overhead=True)
+    assert result['overhead'] > 0
+    assert 0 <= result['corrected_timing'] <= result['timing']
+
+    result = magic_timeit({}, lambda: None, repeat=3, target_time=0.01,
+                          overhead=True)
+    assert result['overhead'] > 0
+    assert 'overhead' not in magic_timeit({}, 'pass', target_time=0.01)
+
+
+def test_gc_policy():
+    enabled = gc.isenabled()
+    assert_equals(gc_call('disabled', gc.isenabled), False)
+    assert_equals(gc_call('enabled', gc.isenabled), True)
+    assert_equals(gc_call('collect', gc.isenabled), True)
+    assert_equals(gc.isenabled(), enabled)
+    assert_raises(ValueError, gc_call, 'sometimes', gc.isenabled)
+
+    stmt = 'lst = [[] for _ in xrange(1000)]'
+    for policy in ('disabled', 'enabled', 'collect'):
+        result = magic_timeit({}, stmt, ncalls=10, repeat=3,
+                              gc_policy=policy)
+        if policy == 'disabled':
+            assert_equals(sum(result['gc_collections']), 0)
+            assert_equals(result['gc_time'], 0)
+        else:
+            assert sum(result['gc_collections']) > 0
+            assert result['gc_time'] >= 0
+
+
+def test_gc_monitor():
+    monitor = GCMonitor()
+    monitor.start()
+    for generation in (0, 1, 2, 2):
+        gc.collect(generation)
+    monitor.stop()
+    gc.collect()
+    assert_equals(monitor.results()['gc_collections'], [1, 1, 2])
+
+    # one collection per call measured, none from the calibration
+    result = magic_timeit({'gc': gc}, 'gc.collect(0)', repeat=3,
+                          target_time=0.01)
+    assert result['calibration_runs'] > 1
+    assert_equals(result['gc_collections'],
+                  [result['loops'] * result['repeat'], 0, 0])
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(precision=0.01)
+    size = len(histogram.counts)
+    histogram.record(np.arange(1, 100001))
+    histogram.record([])
+    assert_equals(histogram.count, 100000)
+    assert_equals(len(histogram.counts), size)
+    assert_equals(histogram.max, 100000)
+    assert abs(histogram.percentile(50) / 50000 - 1) <= 0.01
+    assert abs(histogram.percentile(99) / 99000 - 1) <= 0.01
+    assert_equals(histogram.percentile(100), 100000)
+
+
+def test_magic_latency():
+    result = magic_latency({}, "lst = ['c'] * 100", ncalls=5000, chunk=1000)
+    assert_equals(result['ncalls'], 5000)
+    assert_equals(result['histogram'].count, 5000)
+    assert (result['p50'] <= result['p90'] <= result['p99'] <=
+            result['p99.9'] <= result['max'])
+
+    result = magic_latency({}, lambda: None, ncalls=100)
+    assert_equals(result['ncalls'], 100)
+
+
+def test_magic_memit_peak():
+    # the list is freed before the statement ends, only the peak sees it
+    stmt = "lst = ['c'] * 20000000; time.sleep(0.05); del lst"
+    result = magic_memit({'time': __import__('time')}, stmt, repeat=1)
+    assert result['peak'] > 100
+    assert result['usage'] < result['peak']
+    assert_equals(result['timeline'].max(), result['peak'])
+
+
+def test_fit_complexity():
+    sizes = np.array([1e3, 1e4, 1e5, 1e6])
+    for complexity, timings in [('O(1)', 5.0 + 0 * sizes),
+                                ('O(n)', 2.0 + 3e-3 * sizes),
+                                ('O(n log n)', 1e-4 * sizes * np.log(sizes)),
+                                ('O(n^2)', 1e-9 * sizes ** 2)]:
+        assert_equals(fit_complexity(sizes, timings)[0][0], complexity)
+
+    # the other classes fit noise better, but not significantly
+    rng = np.random.RandomState(0)
+    constant = [fit_complexity(sizes, 1 + 0.05 * rng.randn(4))[0][0]
+                for _ in xrange(200)]
+    assert constant.count('O(1)') >= 180
+
+
+def test_mann_whitney_u():
+    u, p_value = mann_whitney_u([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+    assert_equals(u, 0)
+    assert_almost_equals(p_value, 0.0122, places=4)
+    assert_equals(mann_whitney_u([1, 1, 1], [1, 1, 1]), (4.5, 1.0))
+    # 2 of the 20 orderings of 3 and 3 values are as extreme
+    assert_equals(min_p_value(3, 3), 0.1)
+    assert_almost_equals(min_p_value(5, 5), 2 / 252.0)
+    assert_equals(min_p_value(0, 3), 1.0)
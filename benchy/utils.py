@@ -3,6 +3,18 @@ The :mod:`benchy.utils` module includes various utilites.
 """
 import string
 import os
+import gc
+import imp
+import sys
+import time
+import itertools
+import threading
+import traceback
+import cPickle as pickle
+import hashlib
+import platform
+import weakref
+import numpy as np
 
 
 def indent(string, spaces=4):
@@ -33,6 +45,25 @@ def getTable(results, name, header, numberFormat="%.4g", **kwargs):
     return __asRst(header, reducedTable)
 
 
+def getRowsTable(rows, header, numberFormat="%.4g", **kwargs):
+
+    reducedTable = []
+    for result in rows:
+        row = []
+        for h in header:
+            value = result[h]
+            try:
+                float(value)
+                value = numberFormat % value
+            except:
+                pass
+            value = str(value)
+            row.append(value)
+        reducedTable.append(row)
+
+    return __asRst(header, reducedTable)
+
+
 def getAllTable(results, header, numberFormat="%.4g", **kwargs):
 
     #format = ['%s', '%s', "%.4g", "%d", "%s"]
@@ -43,6 +74,8 @@ def getAllTable(results, header, numberFormat="%.4g", **kwargs):
     reducedTable = []
     for bm, result in results.iteritems():
         result = result['runtime']
+        if not result['success']:
+            continue
         row = []
         result['name'] = bm.name
         for h in header:
@@ -87,7 +120,545 @@ def __columnWidths(header, table):
     return sizes
 
 
-def magic_timeit(ns, stmt, ncalls=None, repeat=3, force_ms=False):
+STATS_HEADER = ['median', 'mean', 'std', 'iqr', 'min', 'max', 'ci_low',
+                'ci_high', 'precision']
+
+
+def sample_stats(samples, confidence=0.95, n_boot=1000, seed=0):
+    """Summary statistics of a set of timing samples.
+
+    Parameters
+    ----------
+
+    samples: the per-repeat timings
+    confidence: level of the confidence interval, optional
+    n_boot: number of bootstrap resamples, optional
+    seed: seed of the bootstrap resampling, optional
+
+    Returns
+    -------
+    stats: dict with the median, mean, standard deviation, interquartile
+           range, min, max, the bounds 'ci_low' and 'ci_high' of a
+           bootstrap confidence interval of the median and its width
+           relative to the median, 'precision'
+    """
+    samples = np.asarray(samples, dtype=float)
+    median = np.median(samples)
+    q1, q3 = np.percentile(samples, [25, 75])
+
+    rng = np.random.RandomState(seed)
+    boot = np.median(rng.choice(samples, (n_boot, len(samples))), axis=1)
+    tail = 50.0 * (1 - confidence)
+    ci_low, ci_high = np.percentile(boot, [tail, 100 - tail])
+
+    return {'median': median,
+            'mean': samples.mean(),
+            'std': samples.std(),
+            'iqr': q3 - q1,
+            'min': samples.min(),
+            'max': samples.max(),
+            'ci_low': ci_low,
+            'ci_high': ci_high,
+            'precision': (ci_high - ci_low) / median}
+
+
+def repeat_until_precise(run, samples, target_precision, max_time=None,
+                         max_repeat=1000, start=None, timer=time.time):
+    """Extend the timing samples with the results of ``run()`` until the
+    confidence interval of their median, see :func:`sample_stats`, is
+    narrower than ``target_precision`` times the median, until
+    ``max_time`` seconds went by since ``start`` on ``timer`` or until
+    there are ``max_repeat`` samples.
+
+    The bootstrap of the interval costs much more than most runs, so it
+    is only computed again once the samples grew by a tenth.
+
+    Returns
+    -------
+    samples: list of the samples
+    """
+    if start is None:
+        start = timer()
+    samples = list(samples)
+    next_check = 0
+    while len(samples) < max_repeat:
+        if len(samples) >= next_check:
+            if sample_stats(samples)['precision'] <= target_precision:
+                break
+            next_check = len(samples) + max(1, len(samples) // 10)
+        if max_time is not None and timer() - start >= max_time:
+            break
+        samples.append(run())
+    return samples
+
+
+COMPLEXITIES = [('O(1)', lambda n: np.zeros_like(n)),
+                ('O(n)', lambda n: n),
+                ('O(n log n)', lambda n: n * np.log(n)),
+                ('O(n^2)', lambda n: n ** 2)]
+
+# one-sided 95% quantiles of Student's t distribution by degrees of freedom,
+# the normal quantile beyond
+T_QUANTILES_95 = [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860,
+                  1.833, 1.812, 1.796, 1.782, 1.771, 1.761, 1.753, 1.746,
+                  1.740, 1.734, 1.729, 1.725, 1.721, 1.717, 1.714, 1.711,
+                  1.708, 1.706, 1.703, 1.701, 1.699, 1.697]
+
+
+def fit_complexity(sizes, timings):
+    """Rank complexity classes by how well they fit a scaling curve.
+
+    Each class is fit as ``timing = a + b * f(size)`` by least squares on
+    the relative errors, so that all the sizes weigh the same. O(1) is
+    nested in every other class, which always fits at least as well, so a
+    class only ranks above O(1) when its growth term ``b`` is significantly
+    positive, by a one-sided t-test at the 5% level. That needs at least
+    three sizes.
+
+    Parameters
+    ----------
+
+    sizes: the input sizes
+    timings: the timing at each size
+
+    Returns
+    -------
+    fits: list of (complexity, residual, (a, b)) tuples, best fit first:
+          the classes with a significant growth by residual, O(1), then
+          the others. Fits where the timings decrease with the size come
+          last
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    timings = np.asarray(timings, dtype=float)
+    dof = len(sizes) - 2
+
+    quantile = None
+    if dof > 0:
+        quantile = (T_QUANTILES_95[dof - 1]
+                    if dof <= len(T_QUANTILES_95) else 1.645)
+
+    fits = []
+    for label, f in COMPLEXITIES:
+        A = np.column_stack([np.ones_like(sizes), f(sizes)]) / timings[:, None]
+        coef = np.linalg.lstsq(A, np.ones_like(sizes), rcond=None)[0]
+        residual = np.sum((A.dot(coef) - 1) ** 2)
+
+        if label == 'O(1)':
+            rank, constant = 0, residual
+        elif coef[1] < 0:
+            rank, residual = 1, float('inf')
+        else:
+            # the squared t statistic of b, as the gain over O(1) against
+            # the variance of the residuals
+            gain = constant - residual
+            significant = (quantile is not None and
+                           gain > max(quantile ** 2 * residual / dof, 1e-12))
+            rank = -1 if significant else 1
+        fits.append((rank, label, residual, tuple(coef)))
+
+    return [fit[1:] for fit in sorted(fits, key=lambda fit: (
+        fit[2] == float('inf'), fit[0], fit[2]))]
+
+
+def mann_whitney_u(x, y):
+    """Two-sided Mann-Whitney U test of two samples.
+
+    The p-value comes from the normal approximation of the statistic,
+    with a continuity correction and a correction for ties, so it is only
+    indicative below a handful of values per sample.
+
+    Parameters
+    ----------
+
+    x: the first sample
+    y: the second sample
+
+    Returns
+    -------
+    u: the U statistic of ``x``
+    p_value: probability of a difference at least as large between two
+             samples of the same distribution
+    """
+    import math
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n1, n2 = len(x), len(y)
+    n = n1 + n2
+
+    # average ranks, starting at 1, of the pooled values
+    values, inverse, counts = np.unique(np.concatenate([x, y]),
+                                        return_inverse=True,
+                                        return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.0
+    ties = (counts ** 3 - counts).sum() / float(n * (n - 1)) if n > 1 else 0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties))
+    if sigma == 0:
+        return u, 1.0
+    z = max(abs(u - n1 * n2 / 2.0) - 0.5, 0) / sigma
+    return u, min(math.erfc(z / math.sqrt(2)), 1.0)
+
+
+def min_p_value(n1, n2):
+    """Smallest two-sided p-value the exact Mann-Whitney U test can reach
+    with samples of sizes ``n1`` and ``n2``, when one sample is entirely
+    below the other."""
+    import math
+
+    if not n1 or not n2:
+        return 1.0
+    n = n1 + n2
+    orderings = math.factorial(n) // (math.factorial(n1) * math.factorial(n2))
+    return min(2.0 / orderings, 1.0)
+
+
+def get_environment():
+    """Return a dict describing the machine and interpreter running the
+    benchmarks."""
+    env = {'platform': platform.platform(),
+           'machine': platform.machine(),
+           'processor': platform.processor(),
+           'python': sys.version.split()[0],
+           'executable': sys.executable}
+    try:
+        import numpy
+        env['numpy'] = numpy.__version__
+    except ImportError:
+        pass
+    return env
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except IOError:
+        return None
+
+
+def _cpu_info():
+    """Return the CPU model and the number of cores."""
+    import multiprocessing
+
+    model, cores = platform.processor(), multiprocessing.cpu_count()
+    try:
+        with open('/proc/cpuinfo') as f:
+            lines = f.readlines()
+    except IOError:
+        return model, cores
+    names = [line.split(':', 1)[1].strip() for line in lines
+             if line.startswith('model name')]
+    processors = [line for line in lines if line.startswith('processor')]
+    return (names[0] if names else model), (len(processors) or cores)
+
+
+def _git_revision(path):
+    import subprocess
+
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=path,
+                stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_fingerprint(env=None, packages=('numpy', 'psutil',
+                                        'memory_profiler'), repo_path='.'):
+    """Return a dict describing the conditions the benchmarks ran in.
+
+    Besides the environment of :func:`get_environment`, it holds the
+    'cpu_model', 'cpu_cores', the CPU frequency 'governor', the
+    'load_average' over 1, 5 and 15 minutes, the 'python_build', the
+    versions of ``packages`` and the 'git_revision' of the repository at
+    ``repo_path``. What is not available is None.
+    """
+    if env is None:
+        env = get_environment()
+    fingerprint = dict(env)
+    fingerprint['cpu_model'], fingerprint['cpu_cores'] = _cpu_info()
+    fingerprint['governor'] = _read_first_line(
+        '/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor')
+    fingerprint['load_average'] = (list(os.getloadavg())
+                                   if hasattr(os, 'getloadavg') else None)
+    fingerprint['python_build'] = ' '.join(
+        (platform.python_implementation(),) + platform.python_build() +
+        (platform.python_compiler(),))
+
+    versions = {}
+    for name in packages:
+        try:
+            versions[name] = getattr(__import__(name), '__version__', None)
+        except ImportError:
+            versions[name] = None
+    fingerprint['packages'] = versions
+    fingerprint['git_revision'] = _git_revision(repo_path)
+    return fingerprint
+
+
+def measure_noise(repeat=20, target_time=0.01):
+    """Time a fixed calibration loop several times, to tell how noisy the
+    machine is.
+
+    Returns
+    -------
+    noise: dict with the 'jitter', the interquartile range of the timings
+           relative to their median, and the 'load', the load average over
+           a minute per core, None where not available
+    """
+    timings = magic_timeit({}, 'sum(xrange(1000))', repeat=repeat,
+                           target_time=target_time)
+    load = None
+    if hasattr(os, 'getloadavg'):
+        load = os.getloadavg()[0] / _cpu_info()[1]
+    return {'jitter': timings['iqr'] / timings['median'], 'load': load}
+
+
+def environment_checksum(env=None):
+    """Short digest identifying an environment, as given by
+    :func:`get_environment`."""
+    if env is None:
+        env = get_environment()
+    return hashlib.md5(repr(sorted(env.items()))).hexdigest()
+
+
+def get_cpu_affinity():
+    """Return the sorted list of CPUs the current process is allowed to
+    run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    try:
+        import psutil
+        return sorted(psutil.Process(os.getpid()).cpu_affinity())
+    except (ImportError, AttributeError):
+        import multiprocessing
+        return range(multiprocessing.cpu_count())
+
+
+def set_cpu_affinity(cpus):
+    """Pin the current process to the given list of CPUs.
+
+    Returns False if the platform does not support CPU affinity."""
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        return True
+    try:
+        import psutil
+        psutil.Process(os.getpid()).cpu_affinity(list(cpus))
+        return True
+    except (ImportError, AttributeError):
+        return False
+
+
+def load_source(name, path):
+    """Import the file at ``path`` as the module ``name``, which does not
+    have to be importable. Dots in the name do not make it part of a
+    package."""
+    module = imp.new_module(name)
+    module.__file__ = path
+    # no implicit relative imports from the parent package the dots name
+    module.__package__ = ''
+    sys.modules[name] = module
+    try:
+        execfile(path, module.__dict__)
+    except:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def fork_call(func, *args, **kwargs):
+    """Call ``func`` in a child process forked from the current one and
+    return its result.
+
+    The child shares the memory of the parent copy-on-write, so whatever
+    the call changes is thrown away with the child. An exception raised by
+    the call is raised again in the parent as a RuntimeError carrying the
+    traceback of the child."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            try:
+                payload = (True, func(*args, **kwargs))
+            except BaseException:
+                payload = (False, traceback.format_exc())
+            with os.fdopen(write_fd, 'wb') as f:
+                pickle.dump(payload, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as f:
+        data = f.read()
+    status = os.waitpid(pid, 0)[1]
+
+    if not data:
+        raise RuntimeError('forked child exited with status %d' % status)
+    success, value = pickle.loads(data)
+    if not success:
+        raise RuntimeError('in forked child:\n' + value)
+    return value
+
+
+def _callable_inner(func):
+    """Return a timeit inner loop calling ``func`` directly, without going
+    through a compiled template and a namespace."""
+    def inner(_it, _timer, _func=func):
+        _t0 = _timer()
+        for _i in _it:
+            _func()
+        _t1 = _timer()
+        return _t1 - _t0
+    return inner
+
+
+def _noop():
+    pass
+
+
+def timer_overhead(number, repeat=3, callable_stmt=False):
+    """Return the time per loop in seconds of timing an empty statement
+    with ``number`` loops, best of ``repeat``: the cost of the timeit loop
+    and of the timer calls, which is part of every timing.
+
+    Parameters
+    ----------
+
+    number: loop count of the timed runs
+    repeat: number of timed runs, optional
+    callable_stmt: measure the loop calling a function instead of the loop
+                   running a statement, optional
+
+    """
+    import timeit
+
+    timer = timeit.Timer(timer=timeit.default_timer)
+    if callable_stmt:
+        timer.inner = _callable_inner(_noop)
+    return min(timer.repeat(repeat, number)) / number
+
+
+def _timer(ns, stmt):
+    """Return a timeit.Timer running ``stmt`` in the namespace ``ns``."""
+    import timeit
+
+    timer = timeit.Timer(timer=timeit.default_timer)
+    # this code has tight coupling to the inner workings of timeit.Timer,
+    # but is there a better way to achieve that the code stmt has access
+    # to the shell namespace?
+
+    if callable(stmt):
+        timer.inner = _callable_inner(stmt)
+    else:
+        src = timeit.template % {'stmt': timeit.reindent(stmt, 8),
+                                 'setup': "pass", 'init': ''}
+        # Track compilation time so it can be reported if too long
+        # Minimum time above which compilation time will be reported
+        code = compile(src, "<magic-timeit>", "exec")
+
+        exec code in ns
+        timer.inner = ns["inner"]
+    return timer
+
+
+GC_POLICIES = ('disabled', 'enabled', 'collect')
+
+
+class _Cycle(object):
+    """Garbage only the collector can free."""
+    def __init__(self):
+        self.cycle = self
+
+
+class GCMonitor(object):
+    """
+    Counts the garbage collections of each generation and the time spent
+    in them, between :meth:`start` and :meth:`stop`.
+
+    With ``gc.callbacks`` both are exact. Without them, as on Python 2,
+    a weak reference to a reference cycle, made again after each
+    collection, has its callback run by every collection. The generation
+    collected is told by ``gc.get_count()``, as a collection resets the
+    counts up to its generation and increments the next one. The time is
+    then None, for the caller to estimate.
+
+    """
+    def __init__(self):
+        self.timed = hasattr(gc, 'callbacks')
+        self.collections = [0] * len(gc.get_threshold())
+        self.time = 0.0
+        self._start = None
+        self._sentinel = None
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._start = time.time()
+        elif self._start is not None:
+            self.time += time.time() - self._start
+            self.collections[info['generation']] += 1
+            self._start = None
+
+    def _arm(self):
+        self._sentinel = weakref.ref(_Cycle(), self._collected)
+
+    def _collected(self, sentinel):
+        if sentinel is not self._sentinel:
+            return
+        counts = gc.get_count()
+        generation = 0 if counts[1] else 1 if counts[2] else 2
+        self.collections[generation] += 1
+        self._arm()
+
+    def start(self):
+        if self.timed:
+            gc.callbacks.append(self._callback)
+        else:
+            self._arm()
+
+    def stop(self):
+        if self.timed:
+            gc.callbacks.remove(self._callback)
+        else:
+            # the callback of a dead weak reference never runs
+            self._sentinel = None
+
+    def results(self):
+        """Return the 'gc_collections' of each generation and the total
+        'gc_time' in seconds, None when it was not timed."""
+        return {'gc_collections': list(self.collections),
+                'gc_time': self.time if self.timed else None}
+
+
+def gc_call(gc_policy, func, *args, **kwargs):
+    """Call ``func`` with the garbage collector 'disabled', 'enabled', or
+    enabled after a collection with 'collect'. The state of the collector
+    is restored afterwards."""
+    if gc_policy not in GC_POLICIES:
+        raise ValueError('unknown gc policy %r' % gc_policy)
+    if gc_policy == 'collect':
+        gc.collect()
+    enabled = gc.isenabled()
+    if gc_policy == 'disabled':
+        gc.disable()
+    else:
+        gc.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if enabled:
+            gc.enable()
+        else:
+            gc.disable()
+
+
+def magic_timeit(ns, stmt, ncalls=None, repeat=3, force_ms=False,
+                 target_precision=None, max_time=None, max_repeat=1000,
+                 target_time=0.2, overhead=False, gc_policy='disabled'):
     """
     Code based on Ipython magic_timeit baseline.
 
@@ -101,7 +672,11 @@ def magic_timeit(ns, stmt, ncalls=None, repeat=3, force_ms=False):
 
     Options:
     -n<N>: execute the given statement <N> times in a loop. If this value
-    is not given, a fitting value is chosen.
+    is not given, a fitting value is chosen: the loop count is grown
+    tenfold until a run is long enough to be timed reliably, and then
+    extrapolated so that one run takes about `target_time` seconds. The
+    calibration runs warm the statement up, and the last one is kept as
+    a sample when it already used the chosen loop count.
 
     -r<R>: repeat the loop iteration <R> times and take the best result.
     Default: 3
@@ -116,6 +691,29 @@ def magic_timeit(ns, stmt, ncalls=None, repeat=3, force_ms=False):
     -p<P>: use a precision of <P> digits to display the timing result.
     Default: 3
 
+    Adaptive repetition, when `target_precision` is given: after the first
+    `repeat` runs, keep repeating until the confidence interval of the
+    median is narrower than `target_precision` times the median (0.01 for
+    1%), until `max_time` seconds have been spent or until `max_repeat`
+    runs were made, see :func:`repeat_until_precise`. The achieved
+    relative width is reported as 'precision' and the number of runs as
+    'repeat'.
+
+    The garbage collector is handled by `gc_policy` during each run:
+    'disabled' as timeit does, 'enabled', or 'collect' to run a full
+    collection before each run and keep the collector enabled. The
+    collections made during the measured runs, the calibration left out,
+    are reported as 'gc_collections', one count per generation, and
+    'gc_time' in seconds. Without ``gc.callbacks``, the time is estimated
+    as the excess of the runs over as many runs, up to 3, with the
+    collector disabled.
+
+    When `overhead` is true, an empty statement is timed with the same
+    loop count, and its time per loop is reported as 'overhead' along with
+    the 'corrected_timing', the timing minus the overhead.
+
+    `stmt` may also be a callable taking no arguments, which is then
+    called in a tight loop and `ns` is unused.
 
     Examples:
 
@@ -144,39 +742,69 @@ def magic_timeit(ns, stmt, ncalls=None, repeat=3, force_ms=False):
     does not matter as long as results from timeit.py are not mixed with
     those from %timeit."""
 
-    import timeit
     import math
 
     units = ["s", "ms", 'us', "ns"]
     scaling = [1, 1e3, 1e6, 1e9]
 
-    timefunc = timeit.default_timer
-
-    timer = timeit.Timer(timer=timefunc)
-    # this code has tight coupling to the inner workings of timeit.Timer,
-    # but is there a better way to achieve that the code stmt has access
-    # to the shell namespace?
-
-    src = timeit.template % {'stmt': timeit.reindent(stmt, 8),
-                             'setup': "pass"}
-    # Track compilation time so it can be reported if too long
-    # Minimum time above which compilation time will be reported
-    code = compile(src, "<magic-timeit>", "exec")
+    timer = _timer(ns, stmt)
+    timefunc = timer.timer
+    def timed(number, monitor):
+        # the collection of the 'collect' policy is not measured
+        if gc_policy == 'collect':
+            gc.collect()
+        monitor.start()
+        try:
+            return gc_call(gc_policy == 'collect' and 'enabled' or gc_policy,
+                           timer.inner, itertools.repeat(None, number),
+                           timefunc)
+        finally:
+            monitor.stop()
 
-    exec code in ns
-    timer.inner = ns["inner"]
+    start = timefunc()
 
+    calibration = []
     if ncalls is None:
-        # determine number so that 0.2 <= total time < 2.0
         number = 1
         for _ in range(1, 10):
-            if timer.timeit(number) >= 0.1:
+            # the collections of a calibration run count only if it is
+            # kept as a sample
+            last_monitor = GCMonitor()
+            elapsed = timed(number, last_monitor)
+            calibration.append((number, elapsed))
+            if elapsed >= target_time / 10:
                 break
             number *= 10
+        if elapsed > 0:
+            number = max(1, int(round(number * target_time / elapsed)))
     else:
         number = ncalls
 
-    best = min(timer.repeat(repeat, number)) / number
+    if calibration and calibration[-1][0] == number:
+        # the last calibration run is a sample like any other
+        monitor = last_monitor
+        samples = [calibration[-1][1]] + [timed(number, monitor)
+                                          for _ in xrange(repeat - 1)]
+    else:
+        monitor = GCMonitor()
+        samples = [timed(number, monitor) for _ in xrange(repeat)]
+    samples = np.array(samples) / number
+    if target_precision is not None:
+        samples = np.array(repeat_until_precise(
+            lambda: timed(number, monitor) / number, samples,
+            target_precision, max_time, max_repeat, start, timefunc))
+    best = samples.min()
+
+    gc_stats = monitor.results()
+    if gc_stats['gc_time'] is None:
+        gc_stats['gc_time'] = 0.0
+        if any(gc_stats['gc_collections']):
+            reference = min(
+                gc_call('disabled', timer.inner,
+                        itertools.repeat(None, number), timefunc)
+                for _ in xrange(min(len(samples), 3)))
+            gc_stats['gc_time'] = max(
+                samples.sum() * number - len(samples) * reference, 0.0)
 
     if force_ms:
         order = 1
@@ -188,14 +816,534 @@ def magic_timeit(ns, stmt, ncalls=None, repeat=3, force_ms=False):
         else:
             order = 3
 
-    return {'loops': number,
-            'repeat': repeat,
-            'timing': best * scaling[order],
-            'units': units[order]}
+    samples *= scaling[order]
+    result = {'loops': number,
+              'calibration_runs': len(calibration),
+              'repeat': len(samples),
+              'timing': best * scaling[order],
+              'samples': samples,
+              'units': units[order]}
+    result.update(sample_stats(samples))
+    result.update(gc_stats)
+    if overhead:
+        result['overhead'] = scaling[order] * timer_overhead(
+            number, repeat, callable(stmt))
+        result['corrected_timing'] = max(
+            result['timing'] - result['overhead'], 0.0)
+    return result
+
+
+class MemorySampler(threading.Thread):
+    """
+    Background thread polling the resident memory of the current process.
+
+    The first sample is taken in :meth:`start`, before the thread runs,
+    and is the baseline the timeline is relative to. Samples are spaced by
+    ``interval`` seconds, as far as the GIL lets the thread run.
+
+    Parameters
+    ----------
+
+    interval: time between two samples in seconds, optional
+
+    """
+    def __init__(self, interval=0.001):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+        import psutil
+        self._process = psutil.Process(os.getpid())
+
+    def _rss(self):
+        return self._process.memory_info().rss / float(2 ** 20)
+
+    def start(self):
+        self.samples.append(self._rss())
+        threading.Thread.start(self)
+
+    def run(self):
+        while not self._done.is_set():
+            self.samples.append(self._rss())
+            time.sleep(self.interval)
+
+    def stop(self):
+        """Stop sampling and return the memory timeline in MB over the
+        baseline."""
+        self._done.set()
+        self.join()
+        self.samples.append(self._rss())
+        return np.array(self.samples) - self.samples[0]
+
+
+LATENCY_PERCENTILES = [50, 90, 99, 99.9]
+
+LATENCY_HEADER = ['p%g' % q for q in LATENCY_PERCENTILES] + ['max']
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of latencies in nanoseconds, with logarithmic buckets.
+
+    Each bucket is ``precision`` times wider than the previous one, so the
+    percentiles are known within that relative error, and the memory used
+    does not depend on the number of latencies recorded.
+
+    Parameters
+    ----------
+
+    precision: relative width of the buckets, optional
+    max_value: largest latency in nanoseconds told apart, optional
+
+    """
+    def __init__(self, precision=0.01, max_value=1e11):
+        self.precision = precision
+        self._log_base = np.log1p(precision)
+        n_buckets = int(np.ceil(np.log(max_value) / self._log_base)) + 1
+        self.counts = np.zeros(n_buckets, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def edges(self):
+        """Lower bound of each bucket in nanoseconds."""
+        return np.exp(np.arange(len(self.counts)) * self._log_base)
+
+    def record(self, values):
+        """Add the latencies ``values``, in nanoseconds."""
+        values = np.maximum(np.asarray(values, dtype=float), 1.0)
+        if not len(values):
+            return
+        buckets = np.minimum((np.log(values) / self._log_base).astype(int),
+                             len(self.counts) - 1)
+        self.counts += np.bincount(buckets, minlength=len(self.counts))
+        self.total += values.sum()
+        self.max = max(self.max, values.max())
+
+    def percentile(self, q):
+        """Return the ``q``-th percentile in nanoseconds, as the upper
+        bound of its bucket."""
+        cumulative = np.cumsum(self.counts)
+        if not cumulative[-1]:
+            return float('nan')
+        bucket = np.searchsorted(cumulative, q / 100.0 * cumulative[-1])
+        return min(np.exp((bucket + 1) * self._log_base), self.max)
+
+
+_latency_template = """
+def inner(_it, _timer, _record):
+    for _i in _it:
+        _t0 = _timer()
+%(stmt)s
+        _record(_timer() - _t0)
+"""
+
+
+def _latency_timer():
+    """Return the finest timer available, and the factor converting its
+    readings to nanoseconds."""
+    import timeit
+
+    if hasattr(time, 'perf_counter_ns'):
+        return time.perf_counter_ns, 1.0
+    return timeit.default_timer, 1e9
+
+
+def _callable_latency_inner(func):
+    def inner(_it, _timer, _record, _func=func):
+        for _i in _it:
+            _t0 = _timer()
+            _func()
+            _record(_timer() - _t0)
+    return inner
+
+
+def magic_latency(ns, stmt, ncalls=10000, max_time=None, chunk=10000,
+                  precision=0.01):
+    """Time each call of a statement on its own.
+
+    The latencies are recorded into a :class:`LatencyHistogram` every
+    `chunk` calls, so memory stays fixed whatever `ncalls`. The garbage
+    collector stays enabled, and its pauses are part of the latencies.
+
+    Parameters
+    ----------
+
+    ns: namespace the statement runs in
+    stmt: the statement, or a callable taking no arguments
+    ncalls: number of calls timed, optional
+    max_time: stop after this many seconds, even before `ncalls` calls,
+              optional
+    chunk: number of latencies buffered before being recorded, optional
+    precision: relative width of the histogram buckets, optional
+
+    Returns
+    -------
+    result: dict with the number of calls 'ncalls', the 'p50', 'p90',
+            'p99', 'p99.9', 'max' and 'mean' latencies in 'units', and
+            the 'histogram'
+    """
+    timer, scale = _latency_timer()
+
+    if callable(stmt):
+        inner = _callable_latency_inner(stmt)
+    else:
+        src = _latency_template % {'stmt': indent(stmt, 8)}
+        code = compile(src, '<magic-latency>', 'exec')
+        exec code in ns
+        inner = ns['inner']
+
+    histogram = LatencyHistogram(precision)
+    start = time.time()
+    done = 0
+    while done < ncalls and (max_time is None or
+                             time.time() - start < max_time):
+        n = min(chunk, ncalls - done)
+        latencies = []
+        inner(xrange(n), timer, latencies.append)
+        histogram.record(np.array(latencies) * scale)
+        done += n
+
+    # in microseconds
+    result = {'ncalls': done,
+              'mean': histogram.total / done / 1e3,
+              'max': histogram.max / 1e3,
+              'histogram': histogram,
+              'units': 'us'}
+    for q in LATENCY_PERCENTILES:
+        result['p%g' % q] = histogram.percentile(q) / 1e3
+    return result
+
+
+def _import_asyncio():
+    try:
+        import asyncio
+    except ImportError:
+        import trollius as asyncio
+    return asyncio
+
+
+def _awaitable_factory(ns, stmt):
+    """Return a function creating a new awaitable on each call, from an
+    expression run in ``ns`` or from a function."""
+    if callable(stmt):
+        return stmt
+    code = compile(stmt, '<magic-asyncit>', 'eval')
+    return lambda: eval(code, ns)
+
+
+class AsyncCall(object):
+    """
+    Callable running an awaitable to completion.
+
+    The event loop is created up front and reused by every call, so that
+    only the awaitable is measured.
+
+    Parameters
+    ----------
+
+    ns: namespace the expression runs in
+    stmt: expression creating the awaitable, or a function returning it
+
+    """
+    def __init__(self, ns, stmt):
+        self.factory = _awaitable_factory(ns, stmt)
+        self._asyncio = _import_asyncio()
+        self.loop = self._asyncio.new_event_loop()
+
+    def __call__(self):
+        # the awaitable may look the loop up while it is created
+        self._asyncio.set_event_loop(self.loop)
+        return self.loop.run_until_complete(self.factory())
+
+    def close(self):
+        self.loop.close()
+
+
+def _run_concurrently(asyncio, loop, factory, ncalls, concurrency, timer,
+                      record):
+    """Await ``ncalls`` awaitables from ``factory`` on ``loop``, keeping
+    ``concurrency`` of them running, and return the timer reading of the
+    whole run. The latency of each awaitable goes to ``record``."""
+    remaining = [ncalls]
+
+    def start(slot):
+        if not remaining[0]:
+            slot.set_result(None)
+            return
+        remaining[0] -= 1
+        t0 = timer()
+        task = asyncio.ensure_future(factory(), loop=loop)
+
+        def done(task):
+            record(timer() - t0)
+            if task.exception() is not None:
+                slot.set_exception(task.exception())
+            else:
+                start(slot)
+        task.add_done_callback(done)
+
+    slots = [asyncio.Future(loop=loop)
+             for _ in xrange(max(1, min(concurrency, ncalls)))]
+    t0 = timer()
+    for slot in slots:
+        start(slot)
+    loop.run_until_complete(asyncio.gather(*slots))
+    return timer() - t0
+
+
+def magic_asyncit(ns, stmt, ncalls=1000, concurrency=(1,), repeat=3,
+                  precision=0.01):
+    """Time the awaitables created by an expression, on an event loop.
+
+    At each concurrency level, `ncalls` awaitables are awaited, with up to
+    that many of them running at once, `repeat` times. Every repeat runs
+    on an event loop of its own, created and closed outside of the
+    measurement.
+
+    Parameters
+    ----------
+
+    ns: namespace the expression runs in
+    stmt: expression creating an awaitable, or a function returning one
+    ncalls: number of awaitables per repeat, optional
+    concurrency: numbers of awaitables running at once, optional
+    repeat: number of runs at each level, optional
+    precision: relative width of the latency histogram buckets, optional
+
+    Returns
+    -------
+    result: dict with the best 'timing' per call at the first level, its
+            'samples', one per repeat, and the results of each one of the
+            'levels': its 'concurrency', best 'throughput' in calls per
+            second, and the 'p50', 'p90', 'p99', 'p99.9', 'max' and
+            'mean' latencies of an awaitable in 'units'
+    """
+    asyncio = _import_asyncio()
+    factory = _awaitable_factory(ns, stmt)
+    timer, scale = _latency_timer()
+
+    levels = []
+    for level in concurrency:
+        histogram = LatencyHistogram(precision)
+        elapsed = []
+        for _ in xrange(repeat):
+            latencies = []
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                elapsed.append(scale / 1e9 * _run_concurrently(
+                    asyncio, loop, factory, ncalls, level, timer,
+                    latencies.append))
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+            histogram.record(np.array(latencies) * scale)
+
+        # in microseconds
+        result = {'concurrency': level,
+                  'elapsed': np.array(elapsed),
+                  'throughput': ncalls / min(elapsed),
+                  'mean': histogram.total / histogram.count / 1e3,
+                  'max': histogram.max / 1e3,
+                  'units': 'us'}
+        for q in LATENCY_PERCENTILES:
+            result['p%g' % q] = histogram.percentile(q) / 1e3
+        levels.append(result)
+
+    samples = levels[0]['elapsed'] / ncalls * 1e3
+    result = {'loops': ncalls,
+              'repeat': repeat,
+              'timing': samples.min(),
+              'samples': samples,
+              'units': 'ms',
+              'levels': levels}
+    result.update(sample_stats(samples))
+    return result
+
+
+def _run_workers(timer, ncalls, n_workers, worker_type, event_type,
+                 queue_type):
+    """Run ``ncalls`` loops of ``timer`` in each one of ``n_workers``
+    threads or processes, released together once all of them started.
+
+    Returns the wall-clock time of the whole run and the time of each
+    worker."""
+    ready, done, go = queue_type(), queue_type(), event_type()
+
+    def work():
+        ready.put(None)
+        go.wait()
+        try:
+            elapsed = timer.inner(itertools.repeat(None, ncalls),
+                                  timer.timer)
+        except Exception:
+            elapsed = traceback.format_exc()
+        done.put(elapsed)
+
+    workers = [worker_type(target=work) for _ in xrange(n_workers)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for _ in workers:
+        ready.get()
+
+    start = timer.timer()
+    go.set()
+    elapsed = [done.get() for _ in workers]
+    wall = timer.timer() - start
+    for worker in workers:
+        worker.join()
+
+    for value in elapsed:
+        if isinstance(value, basestring):
+            raise RuntimeError('in worker:\n' + value)
+    return wall, elapsed
+
+
+def magic_parallelit(ns, stmt, ncalls=1000, workers=(1, 2, 4),
+                     processes=True):
+    """Measure how a statement scales over threads and processes.
+
+    At each level, the statement runs `ncalls` times in each one of that
+    many workers, all started before being released together. Threads
+    show the effect of the GIL, processes forked from the current one
+    the scaling without it.
+
+    Parameters
+    ----------
+
+    ns: namespace the statement runs in
+    stmt: the statement, or a callable taking no arguments
+    ncalls: number of times each worker runs the statement, optional
+    workers: numbers of workers, or the largest one, for 1, 2, 4, ...
+             workers up to it, optional
+    processes: also measure with processes, optional
+
+    Returns
+    -------
+    result: dict with the 'threads' and 'processes' levels, each one
+            with its number of 'workers', the aggregate 'throughput' in
+            calls per second, the mean 'latency' of a call in a worker,
+            in 'units', and the parallel 'efficiency', the throughput per
+            worker relative to the one of the first level
+    """
+    import Queue
+    import multiprocessing
+
+    if isinstance(workers, int):
+        levels = [2 ** i for i in xrange(workers.bit_length())
+                  if 2 ** i < workers]
+        workers = levels + [workers]
+
+    timer = _timer(ns, stmt)
+    modes = [('threads', threading.Thread, threading.Event, Queue.Queue)]
+    if processes:
+        modes.append(('processes', multiprocessing.Process,
+                      multiprocessing.Event, multiprocessing.Queue))
+
+    result = {'ncalls': ncalls, 'workers': list(workers), 'units': 'us'}
+    for mode, worker_type, event_type, queue_type in modes:
+        levels = []
+        for n_workers in workers:
+            wall, elapsed = _run_workers(timer, ncalls, n_workers,
+                                         worker_type, event_type, queue_type)
+            levels.append({'mode': mode,
+                           'workers': n_workers,
+                           'throughput': n_workers * ncalls / wall,
+                           'latency': 1e6 * np.mean(elapsed) / ncalls})
+        reference = levels[0]['throughput'] / levels[0]['workers']
+        for level in levels:
+            level['efficiency'] = (level['throughput'] / level['workers'] /
+                                   reference)
+        result[mode] = levels
+    return result
+
+
+def magic_allocit(ns, stmt, ncalls=1, top=10):
+    """Measure the Python allocations of a statement with tracemalloc.
+
+    The traces are cleared before each one of the `ncalls` runs of the
+    statement, so that a run only sees its own allocations: the blocks it
+    allocated and still holds when it returns, whatever it freed of the
+    older ones, and through the peak of the traced memory since the
+    reset, its temporary allocations too. tracemalloc does not keep the
+    blocks allocated and freed within a run, so their count is not known.
+
+    Parameters
+    ----------
+
+    ns: namespace the statement runs in
+    stmt: the statement, or a callable taking no arguments
+    ncalls: number of times the statement is run, optional
+    top: number of allocation sites reported, optional
+
+    Returns
+    -------
+    result: dict with the number of memory blocks 'retained_blocks' and
+            the 'retained_bytes' allocated per call and still held at its
+            end, the 'peak' memory in bytes allocated at once by a call,
+            the highest of the calls, and the 'top' allocation sites as
+            (site, retained bytes, retained blocks) tuples per call, by
+            decreasing size
+    """
+    import tracemalloc
+
+    if callable(stmt):
+        call = stmt
+    else:
+        code = compile(stmt, '<magic-allocit>', 'exec')
+
+        def call():
+            exec code in ns
+
+    # leave out the allocations of tracemalloc and of this function
+    here = os.path.splitext(__file__)[0] + '.py'
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+              tracemalloc.Filter(False, here)]
+
+    sites, peak = {}, 0
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        for _ in xrange(ncalls):
+            tracemalloc.clear_traces()
+            call()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+            for stat in snapshot.statistics('lineno'):
+                size, count = sites.get(stat.traceback, (0, 0))
+                sites[stat.traceback] = (size + stat.size,
+                                         count + stat.count)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    ranked = sorted(sites.iteritems(), key=lambda site: site[1][0],
+                    reverse=True)
+    calls = float(ncalls)
+    return {'ncalls': ncalls,
+            'retained_blocks': sum(count for _, (_, count) in ranked) / calls,
+            'retained_bytes': sum(size for _, (size, _) in ranked) / calls,
+            'peak': peak,
+            'top': [(str(traceback), size / calls, count / calls)
+                    for traceback, (size, count) in ranked[:top]],
+            'units': 'B'}
+
+
+def _exec(stmt, ns):
+    exec stmt in ns
 
 
 def magic_memit(ns, stmt, ncalls=None, repeat=3, timeout=0, setup='pass',
-            run_in_place=True):
+            run_in_place=True, interval=0.001, gc_policy='enabled'):
 
     """Measure memory usage of a Python statement
 
@@ -213,6 +1361,17 @@ def magic_memit(ns, stmt, ncalls=None, repeat=3, timeout=0, setup='pass',
     -t<T>: timeout after <T> seconds. Unused if `-i` is active.
     Default: None
 
+    While the statement runs, a background thread samples the resident
+    memory every `interval` seconds. Besides 'usage', the difference
+    between the memory after and before the statement, the results give
+    the 'peak' over the memory before the statement, including the
+    temporary allocations freed before it ended, and the 'timeline' of
+    the repeat with the highest peak as a numpy array in MB.
+
+    `stmt` may also be a callable taking no arguments. The garbage
+    collector is handled by `gc_policy` while it runs, see
+    :func:`magic_timeit`.
+
     Examples
     --------
     ::
@@ -252,16 +1411,23 @@ def magic_memit(ns, stmt, ncalls=None, repeat=3, timeout=0, setup='pass',
                'the `-i` option.')
         run_in_place = True
 
+    failed = (float('-inf'), float('-inf'), None)
+
     def _get_usage(q, stmt, setup='pass', ns={}):
-        from memory_profiler import memory_usage as _mu
         try:
             exec setup in ns
-            _mu0 = _mu()[0]
-            exec stmt in ns
-            _mu1 = _mu()[0]
-            q.put(_mu1 - _mu0)
+            sampler = MemorySampler(interval)
+            sampler.start()
+            try:
+                if callable(stmt):
+                    gc_call(gc_policy, stmt)
+                else:
+                    gc_call(gc_policy, _exec, stmt, ns)
+            finally:
+                timeline = sampler.stop()
+            q.put((timeline[-1], timeline.max(), timeline))
         except Exception as e:
-            q.put(float('-inf'))
+            q.put(failed)
             raise e
 
     if run_in_place:
@@ -282,16 +1448,20 @@ def magic_memit(ns, stmt, ncalls=None, repeat=3, timeout=0, setup='pass',
                     print 'Subprocess timed out.'
                 else:
                     print 'Subprocess exited with code %d.' % p.exitcode
-                q.put(float('-inf'))
+                q.put(failed)
 
         if not at_least_one_worked:
             print ('ERROR: all subprocesses exited unsuccessfully. Try '
                    'again with the `-i` option.')
 
     usages = [q.get() for _ in xrange(repeat)]
-    usage = max(usages)
+    usage = max(u[0] for u in usages)
+    _, peak, timeline = max(usages, key=lambda u: u[1])
 
     return {'repeat': repeat,
              'usage':  usage,
+             'peak': peak,
+             'timeline': timeline,
+             'interval': interval,
              'units': 'MB',
     }